@@ -1,4 +1,12 @@
-from units import HR_ZONES
+import json
+import os
+import threading
+import time
+import numpy as np
+import pandas as pd
+from units import HR_ZONES, ZONES_CACHE, ZONES_TTL
+
+ZONE_POLICIES = ['clip', 'nan', 'raise']
 
 class HRZone:
     def __init__(self, title, zone):
@@ -32,3 +40,50 @@ class HRZone:
 
     def __repr__(self):
         return f'{self.title} | {self.zone}'
+
+
+def classifyZones(values, hr, policy='clip'):
+    """
+    Map a whole HR array onto zone buckets ({'min', 'max'} dicts, max of -1 meaning unbounded) in one pass.
+    Returns an ordered pandas Categorical over HR_ZONES. A sample on a boundary belongs to the lower zone
+    (min <= hr <= max). Samples outside every bucket are clipped to the nearest zone, left missing, or raise a
+    ValueError depending on policy.
+    """
+    assert policy in ZONE_POLICIES, f'Policy must be one of the following: {ZONE_POLICIES}'
+    hr = np.asarray(hr, dtype=float)
+    mins = np.array([bucket['min'] for bucket in values], dtype=float)
+    maxes = np.array([np.inf if bucket['max'] == -1 else bucket['max'] for bucket in values], dtype=float)
+    codes = np.searchsorted(maxes, hr, side='left')
+    outside = (codes >= len(values)) | np.isnan(hr)
+    outside |= hr < mins[np.minimum(codes, len(values) - 1)]
+    if outside.any():
+        if policy == 'raise':
+            raise ValueError(f'HR {hr[outside][0]} is out of range')
+        if policy == 'nan':
+            codes[outside] = -1
+    if policy != 'nan':
+        codes = np.clip(codes, 0, len(values) - 1)
+    codes = np.minimum(codes, len(HR_ZONES) - 1)
+    return pd.Categorical.from_codes(codes, categories=HR_ZONES, ordered=True)
+
+
+def getAthleteZones(client, ttl=ZONES_TTL, path=ZONES_CACHE):
+    """
+    Heart rate zone buckets for the authenticated athlete, re-fetched once the cached copy is older than ttl seconds.
+    """
+    if os.path.exists(path):
+        try:
+            with open(path, 'r') as f:
+                cached = json.load(f)
+            if time.time() - cached['fetched_at'] < ttl:
+                return cached['zones']
+        except (ValueError, KeyError, TypeError):
+            pass  # a corrupt cache is refetched like a stale one
+    zones = client.get_athlete_zones().dict()['heart_rate']['zones']
+    zones = [{'min': bucket['min'], 'max': bucket['max']} for bucket in zones]
+    # written aside and moved into place, so concurrent readers never see a partial file
+    temp = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    with open(temp, 'w') as f:
+        json.dump({'fetched_at': time.time(), 'zones': zones}, f)
+    os.replace(temp, path)
+    return zones
@@ -1,5 +1,6 @@
 import units
 import json
+import numpy as np
 
 class Pace:
     def __init__(self, min, sec=0, unit=units.MILES):
@@ -145,4 +146,126 @@ class Pace:
     @staticmethod
     def from_json(json_str):
         data = json.loads(json_str)
-        return Pace.from_dict(data)
\ No newline at end of file
+        return Pace.from_dict(data)
+
+class PaceSeries:
+    """
+    Array of paces stored as float seconds per unit.
+
+    Operations stay vectorized; Pace objects and strings are only built on request.
+    Ordering follows Pace, so max() is the fastest pace and min() the slowest.
+    """
+
+    def __init__(self, seconds, unit=units.MILES):
+        self.seconds = np.asarray(seconds, dtype=float)
+        self.unit = unit
+        if self.unit not in [units.MILES, units.KILOMETERS]:
+            raise ValueError(f"Unit must be miles or kilometers. Got {unit}")
+
+    @property
+    def time(self):
+        return self.seconds
+
+    @property
+    def minutes(self):
+        return self.seconds / 60
+
+    def __len__(self):
+        return len(self.seconds)
+
+    def __getitem__(self, item):
+        if isinstance(item, (int, np.integer)):
+            return Pace.fromSeconds(self.seconds[item], self.unit)
+        return PaceSeries(self.seconds[item], self.unit)
+
+    def __iter__(self):
+        for seconds in self.seconds:
+            yield Pace.fromSeconds(seconds, self.unit)
+
+    def __str__(self):
+        return f"PaceSeries({len(self)} paces/{self.unit}, mean {self.mean()})"
+
+    def __repr__(self):
+        return self.__str__()
+
+    def _other(self, other):
+        if isinstance(other, (Pace, PaceSeries)):
+            if self.unit != other.unit:
+                raise ValueError("Cannot combine Paces with different units")
+            return other.time
+        return other
+
+    def __add__(self, other):
+        return PaceSeries(self.seconds + self._other(other), self.unit)
+
+    def __radd__(self, other):
+        return self.__add__(other)
+
+    def __sub__(self, other):
+        return PaceSeries(self.seconds - self._other(other), self.unit)
+
+    def __mul__(self, other):
+        return PaceSeries(self.seconds * other, self.unit)
+
+    def __truediv__(self, other):
+        return PaceSeries(self.seconds / other, self.unit)
+
+    def __neg__(self):
+        return PaceSeries(-self.seconds, self.unit)
+
+    def __eq__(self, other):
+        return isinstance(other, PaceSeries) and self.unit == other.unit and np.array_equal(self.seconds, other.seconds)
+
+    def convert(self):
+        if self.unit == units.MILES:
+            return PaceSeries(self.seconds / units.FACTOR, units.KILOMETERS)
+        return PaceSeries(self.seconds * units.FACTOR, units.MILES)
+
+    def mean(self):
+        return Pace.fromSeconds(self.seconds.mean(), self.unit)
+
+    def min(self):
+        return Pace.fromSeconds(self.seconds.max(), self.unit)
+
+    def max(self):
+        return Pace.fromSeconds(self.seconds.min(), self.unit)
+
+    def pad(self, length):
+        """
+        Extend to length by repeating the mean pace.
+        """
+        missing = length - len(self)
+        if missing <= 0:
+            return self
+        return PaceSeries(np.concatenate([self.seconds, np.full(missing, self.seconds.mean())]), self.unit)
+
+    def strings(self):
+        """
+        Format every pace as m:ss/unit, missing (NaN) paces as empty strings.
+        """
+        missing = np.isnan(self.seconds)
+        whole = np.maximum(np.where(missing, 0, self.seconds), 0).astype(int)
+        minutes = (whole // 60).astype(str)
+        seconds = np.char.zfill((whole % 60).astype(str), 2)
+        text = np.char.add(np.char.add(np.char.add(minutes, ':'), seconds), f'/{self.unit}')
+        return np.where(missing, '', text) if missing.any() else text
+
+    def toList(self):
+        return [Pace.fromSeconds(seconds, self.unit) for seconds in self.seconds]
+
+    @classmethod
+    def from_mps(cls, speeds_in_mps, stopped=0.0):
+        """
+        Create a PaceSeries from an array of speeds in meters per second (m/s). Zero speeds map to stopped
+        (0:00 by default, NaN to leave them missing).
+        """
+        speeds = np.abs(np.asarray(speeds_in_mps, dtype=float))
+        seconds = np.full_like(speeds, stopped)
+        moving = speeds > 0
+        seconds[moving] = 1609.344 / speeds[moving]
+        return cls(seconds, units.MILES)
+
+    @classmethod
+    def fromPaces(cls, listOfPaces):
+        unit = listOfPaces[0].unit if listOfPaces else units.MILES
+        return cls([pace.time for pace in listOfPaces], unit)
@@ -0,0 +1,176 @@
+import json
+import os
+import numpy as np
+import pandas as pd
+from functions import metersToFeet, metersToMiles
+from HRZone import classifyZones
+from Pace import Pace, PaceSeries
+from profiling import NullProfiler
+from signals import difference, elevationChange, grade, gradeAdjustedVelocity, hrDrift, smooth
+from units import ELEVATION_THRESHOLD, HR_ZONES
+
+PERCENTILES = (10, 25, 50, 75, 90)
+
+
+def _groupedStats(codes, values, groups):
+    """
+    mean/min/max/percentiles of values per zone code from a single sort by (code, value). Missing values are
+    skipped, a zone without any gets NaN.
+    """
+    valid = ~np.isnan(values)
+    if not valid.all():
+        present = np.isin(groups, codes[valid])
+        stats = _groupedStats(codes[valid], values[valid], groups[present])
+        filled = {stat: np.full(len(groups), np.nan) for stat in stats}
+        for stat, values in stats.items():
+            filled[stat][present] = values
+        return filled
+    order = np.lexsort((values, codes))
+    sortedCodes = codes[order]
+    sortedValues = values[order]
+    starts = np.searchsorted(sortedCodes, groups, side='left')
+    ends = np.searchsorted(sortedCodes, groups, side='right')
+    counts = ends - starts
+    sums = np.add.reduceat(sortedValues, starts) if len(starts) else np.array([])
+    stats = {
+        'mean': sums / counts,
+        'min': sortedValues[starts],
+        'max': sortedValues[ends - 1],
+    }
+    for p in PERCENTILES:
+        # linear interpolation between closest ranks, as numpy.percentile does
+        position = starts + (counts - 1) * p / 100
+        low = np.floor(position).astype(int)
+        high = np.minimum(low + 1, ends - 1)
+        stats[f'p{p}'] = sortedValues[low] + (sortedValues[high] - sortedValues[low]) * (position - low)
+    return stats
+
+
+def zoneStats(zones, seconds, columns):
+    """
+    Per-zone sample count, time in zone (seconds) and summary statistics of each numeric column.
+
+    zones is the Categorical from classifyZones, seconds the elapsed time of each sample and columns a
+    {name: array} of the same length. Samples without a zone are ignored, as are missing values of a column.
+    """
+    codes = np.asarray(zones.codes)
+    seconds = np.asarray(seconds, dtype=float)
+    durations = np.diff(seconds, append=seconds[-1]) if len(seconds) else seconds
+    inZone = codes >= 0
+    codes = codes[inZone]
+    groups = np.unique(codes)
+    samples = np.bincount(codes, minlength=len(HR_ZONES))
+    timeInZone = np.bincount(codes, weights=durations[inZone], minlength=len(HR_ZONES))
+    perColumn = {name: _groupedStats(codes, np.asarray(values, dtype=float)[inZone], groups)
+                 for name, values in columns.items()}
+
+    result = {}
+    for i, code in enumerate(groups):
+        zone = zones.categories[code]
+        result[zone] = {'samples': int(samples[code]), 'seconds': float(timeInZone[code])}
+        for name, stats in perColumn.items():
+            result[zone][name] = {stat: float(values[i]) for stat, values in stats.items()}
+    return result
+
+
+def zoneReport(stats):
+    """
+    The per-zone part of <name>_analysis.txt.
+    """
+    # zones only spent stopped have no pace
+    stats = {zone: s for zone, s in stats.items() if not np.isnan(s['Pace']['mean'])}
+    lines = [f'{zone} Average Pace: {Pace.fromSeconds(s["Pace"]["mean"])}' for zone, s in stats.items()]
+    lines.append('\n')
+    # slowest to fastest, as Pace orders faster paces higher
+    lines += [f'{zone} Range: {Pace.fromSeconds(s["Pace"]["max"])} to {Pace.fromSeconds(s["Pace"]["min"])}'
+              for zone, s in stats.items()]
+    return '\n'.join(lines) + '\n'
+
+
+def runFrame(hr, velocity, elevation, timeIdx, distanceIdx, zones, profiler=NullProfiler()):
+    """
+    One row per sample in imperial units: Seconds, Time (min), Distance (mi), HR, Zone, Pace (s/mi), PaceTime
+    (min/mi), PaceStr, Elevation (ft), the elevation and HR gradients, Smoothed Elevation (ft), Grade and
+    GAP (grade adjusted pace, s/mi). Pace and GAP are NaN (PaceStr empty) while stopped.
+    """
+    with profiler.stage('convert'):
+        seconds = np.asarray(timeIdx, dtype=float)
+        data = pd.DataFrame({
+            'Seconds': seconds,
+            'Time': seconds / 60,
+            'Distance': np.round(metersToMiles(np.asarray(distanceIdx, dtype=float)), 2),
+            'HR': np.asarray(hr),
+            'Elevation': np.round(metersToFeet(np.asarray(elevation, dtype=float))).astype(int),
+        })
+    with profiler.stage('pace'):
+        velocity = np.asarray(velocity, dtype=float)
+        pace = PaceSeries.from_mps(velocity, stopped=np.nan)
+        data['Pace'] = pace.seconds
+        data['PaceTime'] = pace.minutes
+        data['PaceStr'] = pace.strings()
+    with profiler.stage('classify'):
+        data['Zone'] = classifyZones(zones, data['HR'])
+    with profiler.stage('signals'):
+        data['Elevation Gradient'] = difference(data['Elevation'].to_numpy())
+        data['HR Gradient'] = difference(data['HR'].to_numpy())
+        smoothed = smooth(elevation)
+        grades = grade(smoothed, distanceIdx)
+        data['Smoothed Elevation'] = metersToFeet(smoothed)
+        data['Grade'] = grades
+        adjusted = gradeAdjustedVelocity(velocity, grades)
+        data['GAP'] = np.divide(1609.344, adjusted, out=np.full(len(adjusted), np.nan), where=adjusted > 0)
+    return data
+
+
+def analyzeRun(data, activityId, name):
+    """
+    The JSON summary and text report for one run frame.
+    """
+    stats = zoneStats(data['Zone'].array, data['Seconds'], {'Pace': data['Pace'], 'HR': data['HR']})
+    moving = data['Pace'].notna().to_numpy()
+    correlation = np.corrcoef(data['HR'].to_numpy(dtype=float)[moving], data['Pace'].to_numpy()[moving])[0, 1]
+    elevationGain, elevationLoss = elevationChange(data['Smoothed Elevation'].to_numpy(),
+                                                   metersToFeet(ELEVATION_THRESHOLD))
+    m = round(elevationGain/3.281, 0)
+    gap = data['GAP'].to_numpy()
+    # decoupling against grade adjusted speed, so a hilly second half doesn't read as drift
+    drift = hrDrift(data['HR'], 1609.344 / gap, data['Seconds'])
+    gap = 1 / np.nanmean(1 / gap) if np.isfinite(gap).any() else float('nan')
+    summary = {
+        'id': int(activityId),
+        'name': name,
+        'zones': stats,
+        'correlation': float(correlation),
+        'elevation_gradient': float(data['Elevation Gradient'].mean()),
+        'hr_gradient': float(data['HR Gradient'].mean()),
+        'elevation_gain_ft': float(elevationGain),
+        'elevation_gain_m': float(m),
+        'elevation_loss_ft': float(elevationLoss),
+        'hr_drift': None if np.isnan(drift) else drift,
+        'grade_adjusted_pace': None if np.isnan(gap) else float(gap),
+    }
+    report = zoneReport(stats)
+    report += f'\n\nCorrelation between Heart Rate and Pace = {float(correlation)}'
+    report += f'\nAverage Elevation Gradient = {summary["elevation_gradient"]}'
+    report += f'\nAverage HR Gradient = {summary["hr_gradient"]}'
+    report += f'\nElevation Gain = {elevationGain} ft | {m} m'
+    report += f'\nElevation Loss = {elevationLoss} ft'
+    if not np.isnan(drift):
+        report += f'\nHR Drift = {drift:.1f}%'
+    if not np.isnan(gap):
+        report += f'\nGrade Adjusted Pace = {Pace.fromSeconds(gap)}'
+    return summary, report
+
+
+def writeAnalysis(folder, name, summary, report):
+    """
+    Write the text report and the machine-readable JSON summary side by side, returning both paths.
+    """
+    if not os.path.exists(folder):
+        os.makedirs(folder)
+    paths = [os.path.join(folder, f'{name}_analysis.txt'), os.path.join(folder, f'{name}_analysis.json')]
+    with open(paths[0], 'w') as f:
+        f.write(report)
+    with open(paths[1], 'w') as f:
+        json.dump(summary, f, indent=2)
+    return paths
@@ -0,0 +1,129 @@
+import os
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import requests
+from fetcher import prefetchStreams
+from HRZone import getAthleteZones
+from profiling import NullProfiler, Profiler
+from units import RESOLUTION
+from store import ActivityStore
+from render import makePlots
+
+_client = None
+_options = {}
+_profiling = None
+_tokens = None
+
+
+def _initWorker(client, options, profiling, tokens):
+    global _client, _options, _profiling, _tokens
+    protocol = getattr(client, 'protocol', None)
+    if protocol is not None and hasattr(protocol, 'rsession'):
+        # the forked client still holds the parent's session and its open connections
+        protocol.rsession = requests.Session()
+    _client = client
+    # runs are already spread over the pool, one run's figures are built in its own worker
+    _options = dict(options, figureWorkers=1)
+    _profiling = profiling
+    _tokens = tokens
+
+
+def _renderOne(rowId):
+    profile, hooks = _profiling
+    profiler = Profiler(hooks, memory=profile, labels={'row': rowId}) if profile or hooks else NullProfiler()
+    if _tokens is not None:
+        # a long batch can outlive the token; the first worker to notice refreshes it for all of them
+        _tokens.authorize(_client)
+    start = time.perf_counter()
+    makePlots(_client, rowId, sync=False, profiler=profiler, **_options)
+    profiler.unwatch(_client)
+    return time.perf_counter() - start, profiler.totals()
+
+
+def parseRange(text):
+    """
+    '1-200' -> rowIds 0..199, matching the 1-based row numbers used on the command line.
+    """
+    first, _, last = text.partition('-')
+    try:
+        first = int(first)
+        last = int(last) if last else first
+    except ValueError:
+        raise ValueError(f'Invalid range {text}, expected FIRST-LAST such as 1-200') from None
+    if not 1 <= first <= last:
+        raise ValueError(f'Invalid range {text}, rows start at 1 and FIRST must not be after LAST')
+    return list(range(first - 1, last))
+
+
+def renderBatch(client, rowIds=None, workers=None, full=False, prefetch=True, profile=False, hooks=(), tokens=None,
+                activityIds=None, **renderOptions):
+    """
+    Sync the activity store once, then render every rowId on a process pool.
+    A failing run is recorded and skipped instead of stopping the batch. rowIds=None renders every stored run.
+    The athlete's zones are fetched here once. With prefetch, missing streams are downloaded concurrently
+    first so workers read them from the cache; without it each worker downloads them over its own HTTP session.
+    renderOptions are passed on to makePlots. Each worker times its stages when profile is set or hooks
+    are given; hooks receive every stage event and the merged per-stage totals are printed with the summary.
+    With a TokenStore, workers take the current access token from it before every run.
+    activityIds (e.g. from selection.selectRuns) select runs by Strava id instead of rowIds, from the store as
+    the selection left it, so it isn't synced again.
+    """
+    with ActivityStore() as store:
+        if activityIds is None:
+            store.sync(client, full=full, need=max(rowIds) + 1 if rowIds else None)
+        runs = store.runs()
+    # zones.json is written once here rather than raced for by the workers
+    getAthleteZones(client)
+    total = len(runs)
+    if activityIds is not None:
+        positions = dict(zip(runs['id'], range(total)))
+        rowIds = [positions.get(int(i), -1) for i in activityIds]
+    if rowIds is None:
+        rowIds = list(range(total))
+    workers = workers or os.cpu_count()
+
+    start = time.perf_counter()
+    profiler = Profiler(memory=False)
+    durations = []
+    failures = {rowId: 'No such run' for rowId in rowIds if not 0 <= rowId < total}
+    if prefetch:
+        fetched = prefetchStreams(client, [int(runs['id'].iloc[r]) for r in rowIds if r not in failures],
+                                  renderOptions.get('resolution', RESOLUTION))
+        print(f"Prefetched streams for {fetched['fetched']} runs with {fetched['requests']} requests")
+        for activityId, reason in fetched['failures'].items():
+            print(f'  streams for {activityId} failed: {reason}')
+    with ProcessPoolExecutor(max_workers=workers, initializer=_initWorker, initargs=(client, renderOptions, (profile, list(hooks)), tokens)) as pool:
+        futures = {pool.submit(_renderOne, rowId): rowId for rowId in rowIds if rowId not in failures}
+        for future in as_completed(futures):
+            rowId = futures[future]
+            try:
+                duration, totals = future.result()
+                durations.append(duration)
+                profiler.merge(totals)
+            except Exception as e:
+                failures[rowId] = ''.join(traceback.format_exception_only(type(e), e)).strip()
+
+    summary = {
+        'requested': len(rowIds),
+        'rendered': len(durations),
+        'failed': len(failures),
+        'workers': workers,
+        'seconds': time.perf_counter() - start,
+        'failures': failures,
+    }
+    printSummary(summary, durations)
+    if profile:
+        print(profiler.report())
+    return summary
+
+
+def printSummary(summary, durations):
+    elapsed = summary['seconds']
+    rate = summary['rendered'] / elapsed if elapsed else 0
+    print(f"Rendered {summary['rendered']}/{summary['requested']} runs with {summary['workers']} workers "
+          f"in {elapsed:.1f}s ({rate:.2f} runs/s)")
+    if durations:
+        print(f'Per run: mean {sum(durations) / len(durations):.2f}s, max {max(durations):.2f}s')
+    for rowId, error in sorted(summary['failures'].items()):
+        print(f'  row {rowId + 1} failed: {error}')
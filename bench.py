@@ -0,0 +1,204 @@
+import argparse
+import json
+import os
+import platform
+import subprocess
+import tempfile
+import time
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+import units
+from analysis import zoneStats
+from downsample import downsample
+from efforts import runEfforts
+from functions import exclude_outliers, gradient
+from HRZone import classifyZones
+from output import FigureWriter
+from Pace import Pace, PaceSeries
+from signals import elevationChange, grade, gradeAdjustedVelocity, hrDrift, smooth
+from store import ActivityStore
+from streams import StreamCache
+from synthetic import DEFAULT_ZONES, SyntheticClient, syntheticActivities, syntheticStreams
+
+DEFAULT_SIZES = [1000, 10000, 100000]
+
+
+def best(function, repeat):
+    """
+    Fastest of repeat calls, in seconds.
+    """
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def streamStages(samples, repeat, folder):
+    """
+    Time each stage of the per-run render pipeline on one synthetic run of samples points.
+    """
+    raw = {kind: data.tolist() for kind, data in syntheticStreams(samples).items()}
+    cache = StreamCache(os.path.join(folder, 'streams'))
+    zones = DEFAULT_ZONES
+    results = {}
+
+    results['ingest'] = best(lambda: cache.put(samples, 'high', raw), repeat)
+    streams = cache.get(samples, 'high')
+    results['ingest_cached'] = best(lambda: {k: np.asarray(v) for k, v in cache.get(samples, 'high').items()
+                                             if v is not None}, repeat)
+
+    velocity = np.asarray(streams['velocity_smooth'])
+    hr = np.asarray(streams['heartrate'])
+    seconds = np.asarray(streams['time'], dtype=float)
+    elevation = np.asarray(streams['altitude'])
+
+    def paceConversion():
+        series = PaceSeries.from_mps(velocity, stopped=np.nan)
+        return series.minutes, series.strings()
+    results['pace_conversion'] = best(paceConversion, repeat)
+    # the per-sample Pace objects makePlots used to build, kept as a reference point
+    legacyRepeat = 1 if samples > 10000 else repeat
+    results['pace_objects'] = best(lambda: sum([Pace.from_mps(v) for v in velocity if v > 0]), legacyRepeat)
+
+    results['zone_classification'] = best(lambda: classifyZones(zones, hr), repeat)
+    categorical = classifyZones(zones, hr)
+    pace = PaceSeries.from_mps(velocity, stopped=np.nan)
+    results['aggregation'] = best(lambda: zoneStats(categorical, seconds, {'Pace': pace.seconds, 'HR': hr}), repeat)
+
+    results['gradient'] = best(lambda: gradient(elevation), repeat)
+    distance = np.asarray(streams['distance'])
+
+    def signalStages():
+        smoothed = smooth(elevation)
+        adjusted = gradeAdjustedVelocity(velocity, grade(smoothed, distance))
+        return elevationChange(smoothed), hrDrift(hr, adjusted, seconds)
+    results['signals'] = best(signalStages, repeat)
+    results['best_efforts'] = best(lambda: runEfforts(distance, seconds), repeat)
+    frame = pd.DataFrame({'Zone': categorical, 'PaceTime': pace.minutes})
+    results['exclude_outliers'] = best(
+        lambda: [exclude_outliers(frame[frame['Zone'] == z], 'PaceTime') for z in frame['Zone'].dropna().unique()],
+        repeat)
+
+    def figureBuild():
+        shown = downsample(seconds, pace.minutes, units.PLOT_POINTS)
+        return go.Figure(data=go.Scatter(x=seconds[shown] / 60, y=pace.minutes[shown], mode='markers+lines',
+                                         text=pace.strings()[shown], marker=dict(color=hr[shown])))
+    results['figure_build'] = best(figureBuild, repeat)
+    fig = figureBuild()
+
+    plots = os.path.join(folder, units.RUN_FOLDER, 'bench', units.PLOT_FOLDER)
+    writer = FigureWriter(plots, 'bench', root=os.path.join(folder, units.RUN_FOLDER))
+    results['html_write'] = best(lambda: writer.add(fig, 'pace_time'), repeat)
+    return results
+
+
+def renderStage(samples, repeat, folder):
+    """
+    Whole makePlots call for one synthetic run, with streams and zones already cached, forced past the manifest.
+    """
+    from render import makePlots
+    client = SyntheticClient(activities=5, samples=samples)
+    # separate store and stream cache per size, the synthetic activity ids repeat
+    scratch = os.path.join(folder, f'render_{samples}')
+    os.makedirs(scratch)
+    current = os.getcwd()
+    os.chdir(scratch)
+    try:
+        makePlots(client, 0)
+        return best(lambda: makePlots(client, 0, sync=False, force=True), repeat)
+    finally:
+        os.chdir(current)
+
+
+def historyStages(count, repeat, folder):
+    activities = syntheticActivities(count)
+    client = SyntheticClient(activities=activities)
+    results = {}
+
+    def fullSync():
+        with ActivityStore(os.path.join(folder, f'history_{count}.db')) as store:
+            store.sync(client, full=True)
+    results['sync_full'] = best(fullSync, repeat)
+
+    with ActivityStore(os.path.join(folder, f'history_{count}.db')) as store:
+        results['sync_incremental'] = best(lambda: store.sync(client), repeat)
+        results['list_runs'] = best(store.runs, repeat)
+        results['get_run'] = best(lambda: store.getRun(count // 3), repeat)
+    return results
+
+
+def commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def runBenchmarks(sizes=DEFAULT_SIZES, history=1000, repeat=3, render=True):
+    """
+    All benchmarks in a scratch folder. Returns a JSON-ready dict of seconds per stage.
+    """
+    report = {
+        'commit': commit(),
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'repeat': repeat,
+        'streams': {},
+        'render': {},
+        'history': {},
+    }
+    with tempfile.TemporaryDirectory() as folder:
+        for samples in sizes:
+            print(f'Streams: {samples} samples')
+            report['streams'][str(samples)] = streamStages(samples, repeat, folder)
+            if render:
+                report['render'][str(samples)] = renderStage(samples, repeat, folder)
+        if history:
+            print(f'History: {history} activities')
+            report['history'][str(history)] = historyStages(history, repeat, folder)
+    return report
+
+
+def compare(current, previous):
+    """
+    Print every stage present in both reports with the change in run time.
+    """
+    print(f"{'stage':<40}{'before':>12}{'after':>12}{'change':>10}")
+    for section in ['streams', 'render', 'history']:
+        for size, stages in current.get(section, {}).items():
+            before = previous.get(section, {}).get(size)
+            if before is None:
+                continue
+            if not isinstance(stages, dict):
+                stages, before = {'total': stages}, {'total': before}
+            for stage, seconds in stages.items():
+                if stage not in before:
+                    continue
+                change = (seconds - before[stage]) / before[stage] * 100 if before[stage] else 0
+                print(f'{section + "/" + size + "/" + stage:<40}{before[stage]:>12.4f}{seconds:>12.4f}{change:>+9.1f}%')
+
+
+def parseArgs(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the render pipeline on synthetic data.')
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES, help='samples per synthetic run')
+    parser.add_argument('--history', type=int, default=1000, help='synthetic activities for the store benchmarks')
+    parser.add_argument('--repeat', type=int, default=3, help='best of this many runs per stage')
+    parser.add_argument('--no-render', dest='render', action='store_false', help='skip the whole-makePlots timing')
+    parser.add_argument('--output', default='benchmarks.json', help='where to write the results')
+    parser.add_argument('--compare', help='earlier results file to compare against')
+    return parser.parse_args(argv)
+
+
+if __name__ == '__main__':
+    args = parseArgs()
+    results = runBenchmarks(args.sizes, args.history, args.repeat, args.render)
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f'Wrote {args.output}')
+    if args.compare:
+        with open(args.compare, 'r') as f:
+            compare(results, json.load(f))
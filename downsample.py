@@ -0,0 +1,74 @@
+import numpy as np
+from units import DOWNSAMPLING_METHODS as METHODS
+
+
+def lttb(x, y, threshold):
+    """
+    Largest-Triangle-Three-Buckets: indices of threshold points that keep the visual shape of y over x.
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.nan_to_num(np.asarray(y, dtype=float))
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+    edges = np.linspace(1, n - 1, threshold - 1).astype(int)
+    selected = np.empty(threshold, dtype=int)
+    selected[0] = 0
+    selected[-1] = n - 1
+    previous = 0
+    for i in range(threshold - 2):
+        start, end = edges[i], edges[i + 1]
+        nextStart, nextEnd = edges[i + 1], edges[i + 2] if i + 2 < len(edges) else n
+        # average of the next bucket is the third corner of the triangle
+        avgX = x[nextStart:nextEnd].mean() if nextEnd > nextStart else x[-1]
+        avgY = y[nextStart:nextEnd].mean() if nextEnd > nextStart else y[-1]
+        area = np.abs((x[previous] - avgX) * (y[start:end] - y[previous])
+                      - (x[previous] - x[start:end]) * (avgY - y[previous]))
+        previous = start + int(area.argmax())
+        selected[i + 1] = previous
+    return selected
+
+
+def minMax(y, threshold):
+    """
+    Indices of the minimum and maximum of each of threshold // 2 buckets, plus both end points.
+    """
+    y = np.nan_to_num(np.asarray(y, dtype=float))
+    n = len(y)
+    buckets = max(threshold // 2, 1)
+    if threshold >= n:
+        return np.arange(n)
+    edges = np.linspace(0, n, buckets + 1).astype(int)
+    starts = edges[:-1]
+    lows = np.minimum.reduceat(y, starts)
+    highs = np.maximum.reduceat(y, starts)
+    bucketOf = np.repeat(np.arange(buckets), np.diff(edges))
+    isLow = np.flatnonzero(y == lows[bucketOf])
+    isHigh = np.flatnonzero(y == highs[bucketOf])
+    # first occurrence of each bucket's extreme
+    firstLow = isLow[np.unique(bucketOf[isLow], return_index=True)[1]]
+    firstHigh = isHigh[np.unique(bucketOf[isHigh], return_index=True)[1]]
+    return np.unique(np.concatenate([[0, n - 1], firstLow, firstHigh]))
+
+
+def transitions(values):
+    """
+    Indices on both sides of every change in values, e.g. HR zone boundaries.
+    """
+    values = np.asarray(values)
+    changed = np.flatnonzero(values[1:] != values[:-1])
+    return np.unique(np.concatenate([changed, changed + 1]))
+
+
+def downsample(x, y, threshold, method='lttb', keep=None):
+    """
+    Sorted indices to plot. threshold <= 0 keeps every point; keep adds indices that must survive.
+    """
+    assert method in METHODS, f'Method must be one of the following: {METHODS}'
+    n = len(y)
+    if threshold <= 0 or n <= threshold:
+        return np.arange(n)
+    indices = lttb(x, y, threshold) if method == 'lttb' else minMax(y, threshold)
+    if keep is not None and len(keep):
+        indices = np.union1d(indices, keep)
+    return indices
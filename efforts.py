@@ -0,0 +1,152 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from Pace import Pace
+from selection import localDate
+from store import RUN_FILTER
+from streams import StreamCache
+from units import BEST_EFFORTS
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS best_efforts (
+    id INTEGER NOT NULL,
+    effort TEXT NOT NULL,
+    seconds REAL,
+    start_seconds REAL,
+    end_seconds REAL,
+    PRIMARY KEY (id, effort)
+);
+CREATE INDEX IF NOT EXISTS best_efforts_effort ON best_efforts (effort, seconds);
+"""
+
+COLUMNS = ['id', 'effort', 'seconds', 'start_seconds', 'end_seconds']
+
+
+def bestEffort(distance, seconds, target):
+    """
+    Fastest stretch of exactly target meters as (seconds, start, end) elapsed times, or None if the run is shorter.
+
+    For every sample taken as the end of the stretch, the start is the last sample at least target meters
+    earlier. Both only ever move forward, as in a two-pointer scan, so all starts are found in one
+    searchsorted over the sorted distances. The start time is then interpolated to make the stretch exactly
+    target meters long.
+    """
+    distance = np.maximum.accumulate(np.asarray(distance, dtype=float))
+    seconds = np.asarray(seconds, dtype=float)
+    if len(distance) < 2 or distance[-1] - distance[0] < target:
+        return None
+    ends = np.arange(np.searchsorted(distance, distance[0] + target, side='left'), len(distance))
+    starts = np.searchsorted(distance, distance[ends] - target, side='right') - 1
+    following = np.minimum(starts + 1, len(distance) - 1)
+    span = distance[following] - distance[starts]
+    fraction = np.divide(distance[ends] - target - distance[starts], span, out=np.zeros(len(ends)), where=span > 0)
+    startTimes = seconds[starts] + (seconds[following] - seconds[starts]) * fraction
+    elapsed = seconds[ends] - startTimes
+    best = int(np.argmin(elapsed))
+    return float(elapsed[best]), float(startTimes[best]), float(seconds[ends[best]])
+
+
+def runEfforts(distance, seconds, efforts=BEST_EFFORTS):
+    """
+    {effort name: bestEffort(...) or None} for one run.
+    """
+    if distance is None or seconds is None:
+        return {name: None for name in efforts}
+    return {name: bestEffort(distance, seconds, target) for name, target in efforts.items()}
+
+
+def _scan(folder, activityIds, resolution, efforts):
+    """
+    Worker: best efforts for each activity whose streams are cached, as best_efforts rows.
+    """
+    cache = StreamCache(folder)
+    rows = []
+    for activity_id in activityIds:
+        streams = cache.get(activity_id, resolution)
+        if streams is None:
+            continue
+        for name, result in runEfforts(streams['distance'], streams['time'], efforts).items():
+            rows.append((activity_id, name) + (result or (None, None, None)))
+    return rows
+
+
+def formatDuration(seconds):
+    minutes, second = divmod(int(round(seconds)), 60)
+    hours, minute = divmod(minutes, 60)
+    return f'{hours}:{minute:02d}:{second:02d}' if hours else f'{minute}:{second:02d}'
+
+
+class BestEfforts:
+    """
+    Fastest 400m, mile, 5k, 10k and half marathon (units.BEST_EFFORTS) of every run, kept in the activity store.
+
+    A run is scanned once; update() only scans runs without a row for every configured effort, in parallel.
+    Runs shorter than an effort get a row without seconds so they aren't scanned again.
+    """
+
+    def __init__(self, store, cache=None, efforts=BEST_EFFORTS):
+        self.store = store
+        self.cache = cache if cache is not None else StreamCache()
+        self.efforts = efforts
+        self.store.conn.executescript(SCHEMA)
+
+    def pending(self):
+        names = list(self.efforts)
+        query = f'SELECT id FROM activities WHERE {RUN_FILTER} AND id NOT IN (' \
+                f'SELECT id FROM best_efforts WHERE effort IN ({", ".join("?" * len(names))}) ' \
+                f'GROUP BY id HAVING COUNT(*) = ?)'
+        return [row[0] for row in self.store.conn.execute(query, names + [len(names)])]
+
+    def update(self, client=None, resolution='high', workers=None):
+        """
+        Scan runs that haven't been scanned. With a client, missing streams are downloaded first; without one
+        only runs whose streams are already cached are scanned. Returns the number of runs scanned.
+        """
+        pending = self.pending()
+        if client is not None and pending:
+            from fetcher import prefetchStreams
+            prefetchStreams(client, pending, resolution, cache=self.cache)
+        if not pending:
+            return 0
+        workers = min(workers or os.cpu_count(), len(pending))
+        chunks = [pending[i::workers] for i in range(workers)]
+        if workers > 1:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                results = pool.map(_scan, [self.cache.folder] * workers, chunks, [resolution] * workers,
+                                   [self.efforts] * workers)
+                rows = [row for chunk in results for row in chunk]
+        else:
+            rows = _scan(self.cache.folder, pending, resolution, self.efforts)
+        with self.store.conn:
+            self.store.conn.executemany(
+                f'INSERT OR REPLACE INTO best_efforts ({", ".join(COLUMNS)}) VALUES ({", ".join("?" * len(COLUMNS))})',
+                rows
+            )
+        return len({row[0] for row in rows})
+
+    def forRun(self, activity_id):
+        """
+        {effort: (seconds, start_seconds, end_seconds) or None} for one run, in BEST_EFFORTS order.
+        """
+        query = 'SELECT effort, seconds, start_seconds, end_seconds FROM best_efforts WHERE id = ?'
+        found = {row[0]: row[1:] if row[1] is not None else None
+                 for row in self.store.conn.execute(query, (activity_id,))}
+        return {name: found.get(name) for name in self.efforts}
+
+    def personalBests(self):
+        """
+        (effort, seconds, activity id, name, start date) of the fastest run for each effort, in BEST_EFFORTS order.
+        """
+        # SQLite takes the bare columns from the row holding MIN(seconds)
+        query = 'SELECT b.effort, MIN(b.seconds), a.id, a.name, a.start_date FROM best_efforts b ' \
+                'JOIN activities a ON a.id = b.id WHERE b.seconds IS NOT NULL GROUP BY b.effort'
+        found = {row[0]: row for row in self.store.conn.execute(query)}
+        return [found[name] for name in self.efforts if name in found]
+
+    def report(self):
+        lines = [f"{'effort':<8}{'time':>10}{'pace':>12}  {'date':<12}name"]
+        for effort, seconds, _, name, startDate in self.personalBests():
+            miles = self.efforts[effort] / 1609.344
+            lines.append(f'{effort:<8}{formatDuration(seconds):>10}{str(Pace.fromSeconds(seconds / miles)):>12}  '
+                         f'{localDate(startDate):<12}{name}')
+        return '\n'.join(lines)
@@ -0,0 +1,113 @@
+import os
+import numpy as np
+import pandas as pd
+import units
+from store import RUN_FILTER
+
+try:
+    import pyarrow
+    import pyarrow.dataset
+    import pyarrow.parquet
+except ImportError:  # exports are skipped, everything else works without pyarrow
+    pyarrow = None
+
+# run frame column -> (exported column, dtype); PaceStr is left out, it's PaceTime formatted
+EXPORT_COLUMNS = {
+    'Seconds': ('seconds', 'int32'),
+    'Time': ('time_min', 'float32'),
+    'Distance': ('distance_mi', 'float32'),
+    'HR': ('hr', 'Int16'),
+    'Zone': ('zone', pd.CategoricalDtype(units.HR_ZONES)),
+    'Pace': ('pace_s_mi', 'float32'),
+    'PaceTime': ('pace_min_mi', 'float32'),
+    'Elevation': ('elevation_ft', 'int16'),
+    'Elevation Gradient': ('elevation_gradient', 'float32'),
+    'HR Gradient': ('hr_gradient', 'float32'),
+    'Smoothed Elevation': ('smoothed_elevation_ft', 'float32'),
+    'Grade': ('grade', 'float32'),
+    'GAP': ('gap_s_mi', 'float32'),
+}
+
+
+def available():
+    return pyarrow is not None
+
+
+def compactFrame(data, activityId):
+    """
+    The exported columns of a run frame with compact dtypes, Zone as a categorical over every HR zone so all
+    runs share one schema.
+    """
+    columns = {'activity_id': pd.Series(np.full(len(data), int(activityId), dtype=np.int64), index=data.index)}
+    for column, (name, dtype) in EXPORT_COLUMNS.items():
+        values = data[column]
+        if dtype in ['int16', 'int32', 'Int16']:
+            values = values.round()
+        columns[name] = values.astype(dtype)
+    return pd.DataFrame(columns).reset_index(drop=True)
+
+
+def datasetPath(activityId, startDate, root=None):
+    """
+    Hive-style partition file of a run: <root>/year=YYYY/month=M/<activityId>.parquet, by UTC start month.
+    """
+    root = root or os.path.join(units.RUN_FOLDER, units.DATASET_FOLDER)
+    startDate = pd.Timestamp(startDate)
+    return os.path.join(root, f'year={startDate.year}', f'month={startDate.month}', f'{int(activityId)}.parquet')
+
+
+def _writeParquet(table, path):
+    folder = os.path.dirname(path)
+    if not os.path.exists(folder):
+        os.makedirs(folder)
+    temp = f'{path}.{os.getpid()}.tmp'
+    pyarrow.parquet.write_table(table, temp, compression='zstd')
+    os.replace(temp, path)
+    return path
+
+
+def writeExport(folder, name, data, activityId, startDate, root=None):
+    """
+    Write a run frame as <folder>/<name>.parquet and into the partitioned dataset, returning both paths.
+    """
+    table = pyarrow.Table.from_pandas(compactFrame(data, activityId), preserve_index=False)
+    return [_writeParquet(table, os.path.join(folder, f'{name}.parquet')),
+            _writeParquet(table, datasetPath(activityId, startDate, root))]
+
+
+def openDataset(root=None):
+    """
+    The partitioned dataset of every exported run as a pyarrow Dataset, year and month being partition columns.
+    Filters on them skip whole folders and filters on other columns use the Parquet row group statistics, e.g.
+    openDataset().to_table(columns=['hr', 'pace_s_mi'], filter=(ds.field('year') == 2025) & (ds.field('hr') > 160)).
+    """
+    root = root or os.path.join(units.RUN_FOLDER, units.DATASET_FOLDER)
+    return pyarrow.dataset.dataset(root, format='parquet', partitioning='hive')
+
+
+def exportHistory(store, zones, client=None, resolution=units.RESOLUTION, force=False, root=None):
+    """
+    Add every stored run that isn't in the dataset yet, so it covers runs that were never rendered. With a client,
+    missing streams are downloaded first. Returns the number of runs exported.
+    """
+    from analysis import runFrame
+    from streams import StreamCache
+    cache = StreamCache()
+    runs = [(int(activityId), startDate) for activityId, startDate in
+            store.conn.execute(f'SELECT id, start_date FROM activities WHERE {RUN_FILTER}')]
+    pending = [(activityId, startDate) for activityId, startDate in runs
+               if force or not os.path.exists(datasetPath(activityId, startDate, root))]
+    if client is not None and pending:
+        from fetcher import prefetchStreams
+        prefetchStreams(client, [activityId for activityId, _ in pending], resolution, cache=cache)
+    exported = 0
+    for activityId, startDate in pending:
+        streams = cache.get(activityId, resolution)
+        if streams is None:
+            continue
+        data = runFrame(streams['heartrate'], streams['velocity_smooth'], streams['altitude'], streams['time'],
+                        streams['distance'], zones)
+        table = pyarrow.Table.from_pandas(compactFrame(data, activityId), preserve_index=False)
+        _writeParquet(table, datasetPath(activityId, startDate, root))
+        exported += 1
+    return exported
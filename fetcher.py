@@ -0,0 +1,218 @@
+import asyncio
+import email.utils
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from requests.adapters import HTTPAdapter
+from streams import StreamCache, STREAM_TYPES
+from units import STRAVA_API, FETCH_CONCURRENCY, FETCH_RETRIES
+
+SHORT, DAILY = 0, 1
+DEFAULT_LIMITS = (100, 1000)
+# Strava quotas reset on the quarter hour and at midnight UTC, i.e. on multiples of these lengths since the epoch
+DEFAULT_WINDOWS = (15 * 60, 24 * 60 * 60)
+
+
+def nextReset(now, length):
+    return (now // length + 1) * length
+
+
+def parsePair(value):
+    if not value:
+        return None
+    pieces = [int(piece) for piece in value.split(',')[:2]]
+    return tuple(pieces) if len(pieces) == 2 else None
+
+
+class TokenBucket:
+    """
+    Request tokens for the short and daily windows.
+
+    Buckets refill when their window resets and are re-synced from the X-RateLimit-Limit/Usage headers on
+    every response, so requests made elsewhere with the same application count too. One bucket can be shared by
+    threads fetching for several athletes of the same application.
+    """
+
+    def __init__(self, limits=DEFAULT_LIMITS, windows=DEFAULT_WINDOWS, clock=time.time):
+        self.clock = clock
+        self.windows = windows
+        self.limits = list(limits)
+        self.tokens = list(limits)
+        now = clock()
+        self.resets = [nextReset(now, length) for length in windows]
+        self.lock = threading.Lock()
+
+    def refill(self):
+        now = self.clock()
+        for window in (SHORT, DAILY):
+            if now >= self.resets[window]:
+                self.tokens[window] = self.limits[window]
+                self.resets[window] = nextReset(now, self.windows[window])
+
+    def wait(self):
+        """
+        Seconds until a request may be sent, 0 when a token is available.
+        """
+        self.refill()
+        empty = [self.resets[window] for window in (SHORT, DAILY) if self.tokens[window] <= 0]
+        return max(empty) - self.clock() if empty else 0
+
+    def take(self):
+        """
+        Take a token and return 0, or return the seconds to wait when none is available.
+        """
+        with self.lock:
+            delay = self.wait()
+            if delay <= 0:
+                self.tokens[SHORT] -= 1
+                self.tokens[DAILY] -= 1
+            return max(delay, 0)
+
+    async def acquire(self):
+        delay = self.take()
+        while delay > 0:
+            await asyncio.sleep(delay)
+            delay = self.take()
+
+    def block(self):
+        """
+        acquire for synchronous callers.
+        """
+        delay = self.take()
+        while delay > 0:
+            time.sleep(delay)
+            delay = self.take()
+
+    def update(self, headers):
+        limits = parsePair(headers.get('X-ReadRateLimit-Limit')) or parsePair(headers.get('X-RateLimit-Limit'))
+        usage = parsePair(headers.get('X-ReadRateLimit-Usage')) or parsePair(headers.get('X-RateLimit-Usage'))
+        with self.lock:
+            if limits:
+                self.limits = list(limits)
+            if usage:
+                self.tokens = [min(self.tokens[w], self.limits[w] - usage[w]) for w in (SHORT, DAILY)]
+
+    def exhaust(self, retryAfter=None):
+        """
+        Called on a 429: no more requests until the server says so or the short window resets.
+        """
+        with self.lock:
+            self.tokens[SHORT] = 0
+            if retryAfter:
+                self.resets[SHORT] = self.clock() + retryAfter
+
+
+def retryAfter(headers):
+    value = headers.get('Retry-After')
+    if not value:
+        return None
+    if value.isdigit():
+        return int(value)
+    return max(0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+
+
+class StreamFetcher:
+    """
+    Download streams for many activities concurrently over one pooled HTTP session.
+
+    Results go straight into the StreamCache, so an interrupted backfill resumes with the activities it had
+    not stored yet.
+    """
+
+    def __init__(self, access_token, baseUrl=STRAVA_API, concurrency=FETCH_CONCURRENCY, retries=FETCH_RETRIES,
+                 cache=None, session=None, bucket=None):
+        self.baseUrl = baseUrl.rstrip('/')
+        self.concurrency = concurrency
+        self.retries = retries
+        self.cache = cache if cache is not None else StreamCache()
+        self.bucket = bucket if bucket is not None else TokenBucket()
+        self.session = session if session is not None else pooledSession(concurrency)
+        # per request rather than on the session, which may be shared by fetchers for other athletes
+        self.headers = {'Authorization': f'Bearer {access_token}'}
+        self.requests = 0
+        self.failures = {}
+
+    def url(self, activity_id):
+        return f'{self.baseUrl}/activities/{int(activity_id)}/streams'
+
+    def get(self, activity_id, resolution):
+        params = {'keys': ','.join(STREAM_TYPES), 'key_by_type': 'true', 'resolution': resolution}
+        return self.session.get(self.url(activity_id), params=params, headers=self.headers, timeout=30)
+
+    async def fetchOne(self, loop, executor, semaphore, activity_id, resolution):
+        async with semaphore:
+            attempt = 0
+            while attempt <= self.retries:
+                await self.bucket.acquire()
+                try:
+                    response = await loop.run_in_executor(executor, self.get, activity_id, resolution)
+                except requests.RequestException as e:
+                    self.failures[activity_id] = str(e)
+                    attempt += 1
+                    await asyncio.sleep(2 ** attempt)
+                    continue
+                self.requests += 1
+                self.bucket.update(response.headers)
+                if response.status_code == 429:
+                    # not counted as an attempt, the bucket holds every task until the quota resets
+                    self.bucket.exhaust(retryAfter(response.headers))
+                    continue
+                if response.status_code >= 500:
+                    self.failures[activity_id] = f'HTTP {response.status_code}'
+                    attempt += 1
+                    await asyncio.sleep(2 ** attempt)
+                    continue
+                if response.status_code != 200:
+                    self.failures[activity_id] = f'HTTP {response.status_code}'
+                    return
+                body = response.json()
+                self.cache.put(activity_id, resolution, {kind: body[kind]['data'] for kind in STREAM_TYPES if kind in body})
+                self.failures.pop(activity_id, None)
+                return
+            self.failures.setdefault(activity_id, 'Retries exhausted')
+
+    async def fetchAll(self, activityIds, resolution='high'):
+        missing = [a for a in dict.fromkeys(activityIds) if not self.cached(a, resolution)]
+        loop = asyncio.get_running_loop()
+        semaphore = asyncio.Semaphore(self.concurrency)
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            await asyncio.gather(*(self.fetchOne(loop, executor, semaphore, a, resolution) for a in missing))
+        return {'requested': len(activityIds), 'fetched': len(missing) - len(self.failures),
+                'requests': self.requests, 'failures': dict(self.failures)}
+
+    def cached(self, activity_id, resolution):
+        return self.cache.contains(activity_id, resolution)
+
+    def run(self, activityIds, resolution='high'):
+        return asyncio.run(self.fetchAll(activityIds, resolution))
+
+
+def pooledSession(size=FETCH_CONCURRENCY):
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=size, pool_maxsize=size)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+def prefetchStreams(client, activityIds, resolution='high', **kwargs):
+    """
+    Fill the stream cache for activityIds with the client's token before they are rendered.
+
+    Recording and replay clients (anything with fixtures) are asked one stream at a time instead, so every
+    response is recorded or served from disk.
+    """
+    if hasattr(client, 'fixtures'):
+        from functions import get_activity_streams
+        cache = kwargs.get('cache') or StreamCache()
+        missing = [i for i in dict.fromkeys(activityIds) if not cache.contains(i, resolution)]
+        failures = {}
+        for activity_id in missing:
+            try:
+                get_activity_streams(client, activity_id, resolution, cache=cache)
+            except Exception as e:
+                failures[activity_id] = repr(e)
+        return {'requested': len(activityIds), 'fetched': len(missing) - len(failures), 'requests': len(missing),
+                'failures': failures}
+    return StreamFetcher(client.access_token, **kwargs).run(activityIds, resolution)
@@ -0,0 +1,199 @@
+import functools
+import multiprocessing
+import os
+import sys
+import threading
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import plotly
+import plotly.express as px
+import plotly.graph_objects as go
+import units
+from downsample import downsample, transitions
+from functions import exclude_outliers
+from manifest import digest, sourceVersion
+
+ZONE_COLORS = {
+    'Endurance': 'green',
+    'Moderate': 'yellow',
+    'Tempo': 'orange',
+    'Threshold': 'red',
+    'Redline': 'black'
+}
+
+
+def zonePartition(frame):
+    """
+    [(zone, rows of frame in that zone)] in order of first appearance, from one sort of the zone codes instead of
+    a comparison over the whole frame per zone.
+    """
+    codes = frame['Zone'].cat.codes.to_numpy()
+    order = np.argsort(codes, kind='stable')
+    ordered = codes[order]
+    starts = np.flatnonzero(np.r_[True, ordered[1:] != ordered[:-1]])
+    groups = {ordered[start]: order[start:end] for start, end in zip(starts, np.r_[starts[1:], len(order)])}
+    # unclassified samples (code -1) belong to no zone
+    present = sorted((rows[0], code) for code, rows in groups.items() if code >= 0)
+    categories = frame['Zone'].cat.categories
+    return [(categories[code], frame.iloc[groups[code]]) for _, code in present]
+
+
+def figureContext(data, name, points=units.PLOT_POINTS, method=units.DOWNSAMPLING):
+    """
+    Everything the figure builders share: the full per-sample frame, the downsampled subsets to plot and their
+    zone partitions.
+    """
+    minutes = data['PaceTime'].to_numpy()
+    hr = data.iloc[downsample(data['Time'], data['HR'], points, method, keep=transitions(data['Zone'].cat.codes))]
+    return {
+        'name': name,
+        'data': data,
+        'zones': zonePartition(data),
+        'pace': data.iloc[downsample(data['Time'], minutes, points, method)],
+        'hr': hr,
+        'hrZones': zonePartition(hr),
+        'elevation': data.iloc[downsample(data['Time'], data['Elevation'], points, method)],
+    }
+
+
+def pacePlot(context, axis):
+    shown = context['pace']
+    # fixed-width numpy strings: plotly copies and encodes them in bulk, object arrays element by element
+    hoverText = (shown['PaceStr'] + ', ' + shown['HR'].astype(str) + ' BPM').to_numpy(dtype=str)
+    fig = go.Figure(data=go.Scatter(
+        x=shown[axis],
+        y=shown['PaceTime'],
+        mode='markers+lines',
+        text=hoverText,
+        marker=dict(color=shown['HR'], colorscale='solar', colorbar=dict(title='Heart Rate'))
+    ))
+    fig.update_layout(
+        title=f'Pace Plot: {context["name"]}' if axis == 'Time' else 'Pace Plot',
+        xaxis_title=axis,
+        yaxis_title='Pace (min/mi)'
+    )
+    return fig
+
+
+def hrPlot(context, axis):
+    fig = go.Figure()
+    for zone, zone_data in context['hrZones']:
+        fig.add_trace(go.Scatter(
+            x=zone_data[axis],
+            y=zone_data['HR'],
+            mode='lines',
+            name=zone,
+            line=dict(color=ZONE_COLORS[zone], width=1)  # Assign color based on zone
+        ))
+    fig.update_layout(
+        title=f'HR: {context["name"]}',
+        xaxis_title=axis,
+        yaxis_title='HR',
+        autosize=False,
+        width=800,
+        height=600
+    )
+    return fig
+
+
+def paceHrBoxplot(context):
+    fig = go.Figure()
+    for zone, zone_data in context['zones']:
+        # Apply the outlier exclusion function to each zone
+        zone_data = exclude_outliers(zone_data, 'PaceTime')
+        if zone_data.empty:
+            continue
+        fig.add_trace(go.Box(
+            y=zone_data['PaceTime'],  # Numeric pace values for the boxplot
+            name=zone,  # Name of the trace (zone), also its x-axis category
+            text=zone_data['PaceStr'].to_numpy(dtype=str),  # Tooltip labels (string representation of pace)
+            hovertemplate=zone + '<br>Pace: %{text}<extra></extra>',  # Custom tooltip format
+            boxmean=True  # Show mean as a dashed line
+        ))
+    fig.update_layout(
+        title='Pace Distribution by Heart Rate Zone (Outliers Excluded)',
+        xaxis_title='Heart Rate Zone',
+        yaxis_title='Pace (min/mi)',
+        autosize=False,
+        width=800,
+        height=600
+    )
+    return fig
+
+
+def elevationPlot(context, axis):
+    fig = px.line(context['elevation'], x=axis, y='Elevation', title=f'Elevation: {context["name"]}')
+    fig.update_layout(autosize=False, width=800, height=600)
+    return fig
+
+
+def gradientPlot(context):
+    return px.scatter(context['data'], x='HR Gradient', y='Elevation Gradient', title='Elevation Gradient')
+
+
+# kind (file name suffix) -> (builder, keyword arguments), in the order figures are written
+FIGURES = {
+    'pace_time': (pacePlot, {'axis': 'Time'}),
+    'pace_distance': (pacePlot, {'axis': 'Distance'}),
+    'hr_time': (hrPlot, {'axis': 'Time'}),
+    'hr_distance': (hrPlot, {'axis': 'Distance'}),
+    'pace_hr_boxplot': (paceHrBoxplot, {}),
+    'elevation_time_plot': (elevationPlot, {'axis': 'Time'}),
+    'elevation_distance_plot': (elevationPlot, {'axis': 'Distance'}),
+    'elevation_hr_gradient': (gradientPlot, {}),
+}
+
+
+def buildFigures(context, kinds=None):
+    built = []
+    for kind in (FIGURES if kinds is None else kinds):
+        builder, options = FIGURES[kind]
+        built.append((kind, builder(context, **options)))
+    return built
+
+
+_task = None
+
+
+def _startTask(context, writer):
+    global _task
+    _task = (context, writer)
+
+
+def _renderKind(kind):
+    context, writer = _task
+    builder, options = FIGURES[kind]
+    return writer.render(builder(context, **options), kind)
+
+
+def renderFigures(context, kinds, writer, workers=units.FIGURE_WORKERS):
+    """
+    Build every kind and render it with writer (a FigureWriter) as an independent task, on up to workers forked
+    processes (None: one per core). Results are collected into writer in kinds order and returned as
+    [(kind, result)]. Figures are rendered serially off the main thread and outside Linux, where forking isn't safe.
+    """
+    kinds = list(kinds)
+    workers = min(len(kinds), workers or os.cpu_count())
+    forkable = sys.platform.startswith('linux') and threading.current_thread() is threading.main_thread()
+    if workers > 1 and forkable:
+        # forked workers inherit the context rather than unpickling a copy each
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('fork'),
+                                 initializer=_startTask, initargs=(context, writer)) as pool:
+            results = list(pool.map(_renderKind, kinds))
+    else:
+        results = []
+        for kind in kinds:
+            builder, options = FIGURES[kind]
+            results.append(writer.render(builder(context, **options), kind))
+    for kind, result in zip(kinds, results):
+        writer.collect(kind, result)
+    return list(zip(kinds, results))
+
+
+@functools.lru_cache(maxsize=None)
+def figureVersion(kind):
+    """
+    Changes whenever the builder of kind, its arguments or the shared figureContext change.
+    """
+    builder, options = FIGURES[kind]
+    return digest(sourceVersion(builder, figureContext), options, plotly.__version__)
@@ -1,9 +1,8 @@
-import os
-import pickle
 import webbrowser
-import pandas as pd
 from stravalib import Client
-from units import PKL
+from signals import difference
+from streams import StreamCache, STREAM_TYPES
+from tokens import TokenStore, expiryText
 
 
 def metersToFeet(meters):
@@ -12,17 +11,15 @@ def metersToFeet(meters):
 def metersToMiles(meters):
     return meters / 1609.34
 
-def setUpClient(client_id, client_secret):
+def setUpClient(client_id, client_secret, tokens=None):
+    """
+    A client authorized from the token store, refreshed if close to expiry. Only when nothing usable is
+    stored does this fall back to the browser authorization flow.
+    """
     client = Client()
-    if os.path.exists(PKL):
-        with open(PKL, 'rb') as f:
-            client = pickle.load(f)
-            try:
-                client.get_athlete()
-                print('Client works')
-                return client
-            except:
-                pass
+    tokens = tokens or TokenStore(client_id, client_secret)
+    if tokens.authorize(client):
+        return client
 
     try:
         authorize_url = client.authorization_url(client_id=client_id,
@@ -36,53 +33,39 @@ def setUpClient(client_id, client_secret):
     code = input("Code: ")
     code = code.strip()
     tokenStuff = client.exchange_code_for_token(client_id=client_id, client_secret=client_secret, code=code)
-
-    access = tokenStuff['access_token']
-    client.access_token = access
+    tokens.save(tokenStuff)
+    tokens.authorize(client)
     print('Client access token assigned')
-    with open(PKL, 'wb') as f:
-        pickle.dump(client, f)
+    print(f"Token expires at {expiryText(tokenStuff['expires_at'])}")
 
     return client
 
-def getActivities(client):
-    activities = client.get_activities()
-    activity_list = []
-    for activity in activities:
-        activity_dict = {
-            'id': activity.id,
-            'name': activity.name,
-            'start_date': activity.start_date,
-            'distance': activity.distance,  # Convert distance to numeric (meters)
-            'moving_time': activity.moving_time,  # Convert to seconds
-            'elapsed_time': activity.elapsed_time,  # Convert to seconds
-            'total_elevation_gain': activity.total_elevation_gain,
-            'type': activity.type,
-            'average_speed': activity.average_speed if activity.average_speed else None,  # Convert to numeric
-            'max_speed': activity.max_speed if activity.max_speed else None,  # Convert to numeric
-            'average_heartrate': activity.average_heartrate,
-            'max_heartrate': activity.max_heartrate,
-        }
-        activity_list.append(activity_dict)
-
-    myActivities = pd.DataFrame(activity_list)
-    myActivities = myActivities[myActivities['type'].astype(str).apply(lambda x: 'Run' in x)]
-    return myActivities
+def get_activity_streams(client, activity_id, resolution='high', cache=None):
+    """
+    Fetch heart rate, pace (velocity), and elevation streams for a given activity ID.
+    Streams are served from the on-disk StreamCache when this activity was fetched before.
+    """
+    if cache is None:
+        cache = StreamCache()
+    streams = cache.get(activity_id, resolution)
+    if streams is None:
+        fetched = client.get_activity_streams(
+            activity_id,
+            types=STREAM_TYPES,
+            resolution=resolution,
+        )
+        streams = cache.put(activity_id, resolution, {kind: fetched[kind].data for kind in STREAM_TYPES if kind in fetched})
 
-
-def get_activity_streams(client, activity_id, resolution='high'):
-    streams = client.get_activity_streams(
-        activity_id,
-        types=['heartrate', 'velocity_smooth', 'altitude', 'time', 'distance'],
-        resolution=resolution,
-    )
-    heart_rate = streams['heartrate'].data if 'heartrate' in streams else None
-    velocity = streams['velocity_smooth'].data if 'velocity_smooth' in streams else None
-    elevation = streams['altitude'].data if 'altitude' in streams else None
-    time_index = streams['time'].data if 'time' in streams else None
-    distance_index = streams['distance'].data if 'distance' in streams else None
+    heart_rate = streams['heartrate']
+    velocity = streams['velocity_smooth']
+    elevation = streams['altitude']
+    time_index = streams['time']
+    distance_index = streams['distance']
     return heart_rate, velocity, elevation, time_index, distance_index
 
+def gradient(arr, gap=1):
+    return difference(arr, gap)
+
 def diff(s1, s2):
     return s1[~s1.isin(s2)]
 
@@ -98,5 +81,5 @@ def readCredentials(path='credentials.txt'):
     with open(path, 'r') as f:
         lines = f.readlines()
         client_id = lines[0].split(' = ')[1]
-        client_secret = lines[1].split(' = ')[1]
+        client_secret = lines[1].split(' = ')[1].strip()
     return int(client_id), client_secret
\ No newline at end of file
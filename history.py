@@ -0,0 +1,265 @@
+import hashlib
+import json
+import os
+import time
+import numpy as np
+import pandas as pd
+import plotly.express as px
+import plotly.graph_objects as go
+import units
+from functions import metersToMiles
+from HRZone import classifyZones
+from output import FigureWriter
+from signals import elevationChange, grade, gradeAdjustedVelocity, hrDrift, smooth
+from store import RUN_FILTER
+from streams import StreamCache
+from units import HR_ZONES
+
+ZONE_COLUMNS = [f'z{i}_seconds' for i in range(len(HR_ZONES))] + [f'z{i}_pace' for i in range(len(HR_ZONES))]
+SIGNAL_COLUMNS = ['elevation_gain', 'elevation_loss', 'hr_drift', 'gap']
+METRIC_COLUMNS = ['id', 'zones_key', 'trimp', 'hr_seconds'] + ZONE_COLUMNS + SIGNAL_COLUMNS
+# bump when runMetrics changes, so stored rows are recomputed
+METRICS_VERSION = 3
+
+SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS run_metrics (
+    id INTEGER PRIMARY KEY,
+    zones_key TEXT NOT NULL,
+    trimp REAL,
+    hr_seconds REAL,
+    {', '.join(f'{column} REAL' for column in ZONE_COLUMNS + SIGNAL_COLUMNS)}
+);
+"""
+
+# Acute and chronic training load windows (days), as in the usual ATL/CTL fitness model
+ACUTE_DAYS = 7
+CHRONIC_DAYS = 42
+
+
+def zonesKey(zones):
+    return hashlib.sha1(json.dumps([METRICS_VERSION, zones], sort_keys=True).encode()).hexdigest()[:12]
+
+
+def signalMetrics(velocity, time_index, altitude, distance, hr=None):
+    """
+    Elevation gain and loss (m), HR drift (%) and mean grade adjusted pace (s/mi) of one run.
+    """
+    metrics = {column: None for column in SIGNAL_COLUMNS}
+    if altitude is None or distance is None or not len(altitude):
+        return metrics
+    smoothed = smooth(altitude)
+    grades = grade(smoothed, distance)
+    metrics['elevation_gain'], metrics['elevation_loss'] = elevationChange(smoothed)
+    if velocity is not None:
+        adjusted = gradeAdjustedVelocity(velocity, grades)
+        if (adjusted > 0).any():
+            metrics['gap'] = float(1609.344 / adjusted[adjusted > 0].mean())
+        if hr is not None and time_index is not None:
+            drift = hrDrift(hr, adjusted, time_index)
+            metrics['hr_drift'] = None if np.isnan(drift) else drift
+    return metrics
+
+
+def runMetrics(zones, hr, velocity, time_index, altitude=None, distance=None):
+    """
+    Per-run inputs to the history aggregates: seconds and mean pace (s/mi, moving samples only) in each HR
+    zone, an Edwards-style TRIMP, i.e. minutes in zone weighted by zone number, and the signalMetrics.
+    """
+    metrics = {'trimp': None, 'hr_seconds': 0.0}
+    metrics.update({column: None for column in ZONE_COLUMNS})
+    metrics.update(signalMetrics(velocity, time_index, altitude, distance, hr))
+    if hr is None or time_index is None or not len(hr):
+        return metrics
+    time_index = np.asarray(time_index, dtype=float)
+    durations = np.diff(time_index, append=time_index[-1])
+    codes = np.asarray(classifyZones(zones, hr).codes)
+    inZone = codes >= 0
+    seconds = np.bincount(codes[inZone], weights=durations[inZone], minlength=len(HR_ZONES))
+    metrics['trimp'] = float(np.sum(seconds / 60 * np.arange(1, len(HR_ZONES) + 1)))
+    metrics['hr_seconds'] = float(seconds.sum())
+
+    if velocity is not None:
+        velocity = np.asarray(velocity, dtype=float)
+        moving = inZone & (velocity > 0)
+        pace = 1609.344 / velocity[moving]
+        counts = np.bincount(codes[moving], minlength=len(HR_ZONES))
+        sums = np.bincount(codes[moving], weights=pace, minlength=len(HR_ZONES))
+        with np.errstate(invalid='ignore', divide='ignore'):
+            paces = sums / counts
+    else:
+        paces = np.full(len(HR_ZONES), np.nan)
+    for i in range(len(HR_ZONES)):
+        metrics[f'z{i}_seconds'] = float(seconds[i])
+        metrics[f'z{i}_pace'] = None if np.isnan(paces[i]) else float(paces[i])
+    return metrics
+
+
+class History:
+    """
+    Training history across every stored run.
+
+    Per-run metrics are computed once from the cached streams and kept next to the activity list in the
+    activity store, so update() only processes runs that are new (or were computed with other athlete zones).
+    Weekly and monthly roll-ups are grouped from those rows, which takes milliseconds even for thousands of runs.
+    """
+
+    def __init__(self, store, cache=None):
+        self.store = store
+        self.cache = cache if cache is not None else StreamCache()
+        self.store.conn.executescript(SCHEMA)
+        self.migrate()
+
+    def migrate(self):
+        """
+        Add columns introduced after the run_metrics table was created; their rows are recomputed on update().
+        """
+        existing = {row[1] for row in self.store.conn.execute('PRAGMA table_info(run_metrics)')}
+        with self.store.conn:
+            for column in METRIC_COLUMNS:
+                if column not in existing:
+                    self.store.conn.execute(f'ALTER TABLE run_metrics ADD COLUMN {column} REAL')
+
+    def pending(self, zones):
+        query = f'SELECT a.id FROM activities a LEFT JOIN run_metrics m ON a.id = m.id ' \
+                f'WHERE a.{RUN_FILTER} AND (m.id IS NULL OR m.zones_key != ?)'
+        return [row[0] for row in self.store.conn.execute(query, (zonesKey(zones),))]
+
+    def update(self, zones, client=None, resolution='high'):
+        """
+        Compute metrics for runs that don't have them yet. With a client, missing streams are downloaded first;
+        without one only runs whose streams are already cached are processed. Returns the number of runs updated.
+        """
+        pending = self.pending(zones)
+        if client is not None and pending:
+            from fetcher import prefetchStreams
+            prefetchStreams(client, pending, resolution, cache=self.cache)
+        key = zonesKey(zones)
+        rows = []
+        for activity_id in pending:
+            streams = self.cache.get(activity_id, resolution)
+            if streams is None:
+                continue
+            metrics = runMetrics(zones, streams['heartrate'], streams['velocity_smooth'], streams['time'],
+                                 streams['altitude'], streams['distance'])
+            rows.append([activity_id, key] + [metrics[column] for column in METRIC_COLUMNS[2:]])
+        with self.store.conn:
+            self.store.conn.executemany(
+                f'INSERT OR REPLACE INTO run_metrics ({", ".join(METRIC_COLUMNS)}) '
+                f'VALUES ({", ".join("?" * len(METRIC_COLUMNS))})',
+                rows
+            )
+        return len(rows)
+
+    def frame(self):
+        """
+        One row per run with its summary fields and (where computed) stream metrics, indexed by local start date.
+        """
+        query = f'SELECT a.id, a.start_date, a.distance, a.moving_time, a.total_elevation_gain, ' \
+                f'{", ".join("m." + column for column in METRIC_COLUMNS[2:])} ' \
+                f'FROM activities a LEFT JOIN run_metrics m ON a.id = m.id WHERE a.{RUN_FILTER} ORDER BY a.start_date'
+        frame = pd.read_sql_query(query, self.store.conn)
+        utc = pd.to_datetime(frame['start_date'], utc=True).dt.tz_convert(None)
+        # the system's UTC offset at each start, DST included, so runs land in the local day, week and month
+        epochs = (utc - pd.Timestamp(0)) // pd.Timedelta(seconds=1)
+        offsets = [time.localtime(seconds).tm_gmtoff for seconds in epochs]
+        frame['start_date'] = utc + pd.to_timedelta(offsets, unit='s')
+        frame['miles'] = metersToMiles(frame['distance'])
+        return frame.set_index('start_date')
+
+    def rollup(self, frame, period):
+        """
+        Mileage, run count, climb, mean HR drift, time in zone and training load per period ('W' or 'M').
+        """
+        periodic = frame.resample('W-SUN' if period == 'W' else 'MS')
+        summary = pd.DataFrame({
+            'runs': periodic['id'].count(),
+            'miles': periodic['miles'].sum(),
+            'hours': periodic['moving_time'].sum() / 3600,
+            'trimp': periodic['trimp'].sum(),
+            'climb_ft': periodic['elevation_gain'].sum() * 3.28084,
+            'hr_drift': periodic['hr_drift'].mean(),
+        })
+        for i, zone in enumerate(HR_ZONES):
+            summary[zone] = periodic[f'z{i}_seconds'].sum() / 60
+        return summary
+
+    def weekly(self, frame=None):
+        return self.rollup(self.frame() if frame is None else frame, 'W')
+
+    def monthly(self, frame=None):
+        return self.rollup(self.frame() if frame is None else frame, 'M')
+
+    def trainingLoad(self, frame=None):
+        """
+        Daily TRIMP with acute (ATL) and chronic (CTL) load and their difference (form).
+        """
+        frame = self.frame() if frame is None else frame
+        daily = frame['trimp'].fillna(0).resample('D').sum()
+        load = pd.DataFrame({'trimp': daily})
+        load['ATL'] = daily.ewm(span=ACUTE_DAYS, adjust=False).mean()
+        load['CTL'] = daily.ewm(span=CHRONIC_DAYS, adjust=False).mean()
+        load['form'] = load['CTL'] - load['ATL']
+        return load
+
+    def paceAtHr(self, frame=None, period='W'):
+        """
+        Mean pace (s/mi) per HR zone per period, weighting each run by its time in that zone.
+        """
+        frame = self.frame() if frame is None else frame
+        trends = {}
+        for i, zone in enumerate(HR_ZONES):
+            seconds = frame[f'z{i}_seconds'].where(frame[f'z{i}_pace'].notna(), 0).fillna(0)
+            weighted = (frame[f'z{i}_pace'].fillna(0) * seconds).resample('W-SUN' if period == 'W' else 'MS').sum()
+            total = seconds.resample('W-SUN' if period == 'W' else 'MS').sum()
+            trends[zone] = weighted / total.replace(0, np.nan)
+        return pd.DataFrame(trends)
+
+    def figures(self):
+        frame = self.frame()
+        weekly = self.weekly(frame)
+        monthly = self.monthly(frame)
+        load = self.trainingLoad(frame)
+        trends = self.paceAtHr(frame) / 60
+
+        mileage = go.Figure()
+        mileage.add_trace(go.Bar(x=weekly.index, y=weekly['miles'], name='Weekly'))
+        mileage.add_trace(go.Scatter(x=monthly.index, y=monthly['miles'], name='Monthly', mode='lines+markers',
+                                     yaxis='y2'))
+        mileage.update_layout(title='Mileage', yaxis_title='Miles per week',
+                              yaxis2=dict(title='Miles per month', overlaying='y', side='right'))
+
+        zones = px.bar(weekly, x=weekly.index, y=HR_ZONES, title='Time in Zone per Week',
+                       labels={'value': 'Minutes', 'x': 'Week'})
+
+        training = go.Figure()
+        training.add_trace(go.Bar(x=load.index, y=load['trimp'], name='TRIMP', opacity=0.4))
+        for column in ['ATL', 'CTL', 'form']:
+            training.add_trace(go.Scatter(x=load.index, y=load[column], name=column, mode='lines'))
+        training.update_layout(title='Training Load', yaxis_title='TRIMP')
+
+        pace = go.Figure()
+        for zone in HR_ZONES:
+            if trends[zone].notna().any():
+                pace.add_trace(go.Scatter(x=trends.index, y=trends[zone], name=zone, mode='lines+markers',
+                                          connectgaps=True))
+        pace.update_layout(title='Pace at Heart Rate', yaxis_title='Pace (min/mi)', yaxis_autorange='reversed')
+
+        return [('mileage', mileage), ('time_in_zone', zones), ('training_load', training), ('pace_at_hr', pace)]
+
+
+def writeHistory(store, zones, client=None, output=units.OUTPUT_MODE, dashboard=False):
+    """
+    Update the history metrics and write the summary figures and CSV roll-ups under RUN_FOLDER/HISTORY_FOLDER.
+    """
+    history = History(store)
+    updated = history.update(zones, client=client)
+    folder = os.path.join(units.RUN_FOLDER, units.HISTORY_FOLDER)
+    writer = FigureWriter(folder, 'history', mode=output, dashboard=dashboard)
+    for kind, fig in history.figures():
+        writer.add(fig, kind)
+    writer.close()
+    frame = history.frame()
+    history.weekly(frame).to_csv(os.path.join(folder, 'weekly.csv'))
+    history.monthly(frame).to_csv(os.path.join(folder, 'monthly.csv'))
+    print(f'History: {len(frame)} runs, {updated} newly processed')
+    return history
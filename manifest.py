@@ -0,0 +1,121 @@
+import hashlib
+import inspect
+import json
+import os
+import numpy as np
+from units import MANIFEST, RENDER_VERSION
+
+
+def digest(*parts):
+    """
+    Short hex digest of strings, bytes, numpy arrays and JSON-serializable values, in order.
+    """
+    h = hashlib.blake2b(digest_size=16)
+    for part in parts:
+        if isinstance(part, np.ndarray):
+            h.update(str((part.dtype, part.shape)).encode())
+            h.update(np.ascontiguousarray(part).data)
+        elif isinstance(part, bytes):
+            h.update(part)
+        else:
+            h.update(json.dumps(part, sort_keys=True, default=str).encode())
+        h.update(b'\0')
+    return h.hexdigest()
+
+
+def _codeParts(code):
+    parts = [code.co_code, code.co_names]
+    for constant in code.co_consts:
+        parts.append(_codeParts(constant) if inspect.iscode(constant) else repr(constant))
+    return parts
+
+
+def _codeNames(code):
+    names = set(code.co_names)
+    for constant in code.co_consts:
+        if inspect.iscode(constant):
+            names |= _codeNames(constant)
+    return names
+
+
+_MISSING = object()
+
+
+def _isData(value):
+    return not (value is _MISSING or inspect.ismodule(value) or inspect.isclass(value) or callable(value))
+
+
+def _globalParts(function):
+    """
+    The module-level values function reads, by name or as an attribute of a module (units.PLOT_POINTS).
+    """
+    names = _codeNames(function.__code__)
+    scope = getattr(function, '__globals__', {})
+    parts = []
+    for name in sorted(names):
+        value = scope.get(name, _MISSING)
+        if _isData(value):
+            parts.append((name, repr(value)))
+        elif inspect.ismodule(value):
+            parts += [(f'{name}.{attribute}', repr(getattr(value, attribute)))
+                      for attribute in sorted(names) if _isData(getattr(value, attribute, _MISSING))]
+    return parts
+
+
+def _version(thing):
+    if inspect.ismodule(thing):
+        with open(thing.__file__, 'rb') as f:
+            return f.read()
+    # bytecode and constants rather than source text: no file reads, and comment edits don't count
+    return digest(_codeParts(thing.__code__), _globalParts(thing))
+
+
+def sourceVersion(*objects):
+    """
+    Version of the code that produces an artifact: the given functions or modules, the module-level constants
+    those functions read (e.g. figures.ZONE_COLORS), and RENDER_VERSION. Functions they call and output.py's page
+    templates aren't followed, so changes there need a RENDER_VERSION bump.
+    """
+    return digest(RENDER_VERSION, *[_version(o) for o in objects])
+
+
+class Manifest:
+    """
+    What produced each output of a run: <folder>/manifest.json maps an artifact name to the key it was
+    built from, the files it wrote and the stream resolution behind it. An artifact is stale when its key changed or one of its files is gone.
+    """
+
+    def __init__(self, folder):
+        self.path = os.path.join(folder, MANIFEST)
+        self.artifacts = {}
+        if os.path.exists(self.path):
+            with open(self.path, 'r') as f:
+                self.artifacts = json.load(f)['artifacts']
+
+    def fresh(self, artifact, key):
+        entry = self.artifacts.get(artifact)
+        return entry is not None and entry['key'] == key and all(os.path.exists(f) for f in entry['files'])
+
+    def stale(self, keys, force=False):
+        """
+        Names in {artifact: key} that have to be rebuilt.
+        """
+        return [artifact for artifact, key in keys.items() if force or not self.fresh(artifact, key)]
+
+    def record(self, artifact, key, files, resolution=None):
+        self.artifacts[artifact] = {'key': key, 'files': list(files), 'resolution': resolution}
+
+    def resolution(self, artifact):
+        """
+        Stream resolution the artifact was last built from, None when unknown.
+        """
+        return self.artifacts.get(artifact, {}).get('resolution')
+
+    def save(self):
+        folder = os.path.dirname(self.path)
+        if folder and not os.path.exists(folder):
+            os.makedirs(folder)
+        temp = f'{self.path}.{os.getpid()}.tmp'
+        with open(temp, 'w') as f:
+            json.dump({'artifacts': self.artifacts}, f, indent=2)
+        os.replace(temp, self.path)
@@ -0,0 +1,181 @@
+import datetime
+import json
+import os
+from units import FIXTURES
+
+ACTIVITIES = 'activities.json'
+ATHLETE = 'athlete.json'
+ZONES = 'zones.json'
+STREAMS = 'streams'
+
+
+def _read(path):
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+def _write(path, data):
+    folder = os.path.dirname(path)
+    if folder and not os.path.exists(folder):
+        os.makedirs(folder)
+    temp = f'{path}.{os.getpid()}.tmp'
+    with open(temp, 'w') as f:
+        json.dump(data, f)
+    os.replace(temp, path)
+
+
+def _dump(model):
+    return model.model_dump(mode='json', exclude_none=True) if hasattr(model, 'model_dump') else model
+
+
+def _date(value):
+    if value is None:
+        return None
+    if not isinstance(value, datetime.datetime):
+        value = datetime.datetime.fromisoformat(value)
+    return value if value.tzinfo else value.replace(tzinfo=datetime.timezone.utc)
+
+
+class FixtureStream:
+    def __init__(self, data):
+        self.data = data
+
+
+class FixtureZones:
+    def __init__(self, data):
+        self.data = data
+
+    def dict(self):
+        return self.data
+
+
+class RecordedPages:
+    """
+    Passes activities through as they are iterated and hands the ones seen to save at the end, so recording
+    doesn't force the whole history to be listed. per_page is forwarded to the wrapped iterator.
+    """
+
+    def __init__(self, activities, save):
+        self.activities = activities
+        self.save = save
+
+    @property
+    def per_page(self):
+        return getattr(self.activities, 'per_page', None)
+
+    @per_page.setter
+    def per_page(self, value):
+        if hasattr(self.activities, 'per_page'):
+            self.activities.per_page = value
+
+    def __iter__(self):
+        seen = []
+        try:
+            for activity in self.activities:
+                seen.append(activity)
+                yield activity
+        finally:
+            self.save(seen)
+
+
+class RecordingClient:
+    """
+    Wraps a live stravalib Client and saves every response this project uses into a fixture folder that
+    ReplayClient can serve later. Anything else is passed straight through to the wrapped client.
+    """
+
+    def __init__(self, client, fixtures=FIXTURES):
+        self.client = client
+        self.fixtures = fixtures
+
+    def __getattr__(self, item):
+        # only called for names not set on the wrapper; guarded so unpickling doesn't recurse
+        if item == 'client' or item.startswith('__'):
+            raise AttributeError(item)
+        return getattr(self.client, item)
+
+    def __setattr__(self, item, value):
+        # tokens set on the wrapper (TokenStore.authorize) belong to the wrapped client
+        if item in ('client', 'fixtures'):
+            object.__setattr__(self, item, value)
+        else:
+            setattr(self.client, item, value)
+
+    def path(self, *names):
+        return os.path.join(self.fixtures, *names)
+
+    def get_athlete(self):
+        athlete = self.client.get_athlete()
+        _write(self.path(ATHLETE), _dump(athlete))
+        return athlete
+
+    def get_activities(self, before=None, after=None, limit=None):
+        return RecordedPages(self.client.get_activities(before=before, after=after, limit=limit), self.saveActivities)
+
+    def saveActivities(self, activities):
+        recorded = {}
+        if os.path.exists(self.path(ACTIVITIES)):
+            recorded = {a['id']: a for a in _read(self.path(ACTIVITIES))}
+        for activity in activities:
+            recorded[activity.id] = _dump(activity)
+        _write(self.path(ACTIVITIES), sorted(recorded.values(), key=lambda a: a['start_date'], reverse=True))
+
+    def get_activity_streams(self, activity_id, types=None, resolution=None, series_type=None):
+        streams = self.client.get_activity_streams(activity_id, types=types, resolution=resolution,
+                                                   series_type=series_type)
+        _write(self.path(STREAMS, f'{int(activity_id)}_{resolution}.json'),
+               {kind: list(stream.data) for kind, stream in streams.items()})
+        return streams
+
+    def get_athlete_zones(self):
+        zones = self.client.get_athlete_zones()
+        _write(self.path(ZONES), zones.dict())
+        return zones
+
+
+class ReplayClient:
+    """
+    Same method surface as the parts of stravalib.Client this project calls, answered from a fixture folder
+    written by RecordingClient. Never touches the network.
+    """
+
+    access_token = None
+
+    def __init__(self, fixtures=FIXTURES):
+        self.fixtures = fixtures
+        self._activities = None
+
+    def path(self, *names):
+        return os.path.join(self.fixtures, *names)
+
+    def missing(self, path):
+        return FileNotFoundError(f'No recorded fixture {path}; record it first with --record')
+
+    def get_athlete(self):
+        if not os.path.exists(self.path(ATHLETE)):
+            raise self.missing(self.path(ATHLETE))
+        from stravalib import model
+        return model.DetailedAthlete.model_validate(_read(self.path(ATHLETE)))
+
+    def get_activities(self, before=None, after=None, limit=None):
+        if self._activities is None:
+            from stravalib import model
+            recorded = _read(self.path(ACTIVITIES)) if os.path.exists(self.path(ACTIVITIES)) else []
+            self._activities = [model.SummaryActivity.model_validate(a) for a in recorded]
+        before, after = _date(before), _date(after)
+        # newest first, oldest first when listing from after, as Strava does
+        ordered = reversed(self._activities) if after is not None else self._activities
+        selected = [a for a in ordered
+                    if (after is None or _date(a.start_date) > after) and (before is None or _date(a.start_date) < before)]
+        return selected[:limit] if limit else selected
+
+    def get_activity_streams(self, activity_id, types=None, resolution=None, series_type=None):
+        path = self.path(STREAMS, f'{int(activity_id)}_{resolution}.json')
+        if not os.path.exists(path):
+            raise self.missing(path)
+        return {kind: FixtureStream(data) for kind, data in _read(path).items() if not types or kind in types}
+
+    def get_athlete_zones(self):
+        if not os.path.exists(self.path(ZONES)):
+            raise self.missing(self.path(ZONES))
+        return FixtureZones(_read(self.path(ZONES)))
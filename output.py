@@ -0,0 +1,162 @@
+import html
+import os
+import uuid
+import numpy as np
+import plotly
+import units
+from units import OUTPUT_MODES
+
+try:
+    import orjson
+except ImportError:  # plotly's encoder, much slower on hover text and long traces
+    orjson = None
+
+
+def sharedPlotlyJs(root=units.RUN_FOLDER):
+    """
+    Write plotly.js once per output root and return its path. The file name carries the plotly version so
+    upgrading plotly never serves figures a stale bundle.
+    """
+    path = os.path.join(root, f'plotly-{plotly.__version__}.min.js')
+    if not os.path.exists(path):
+        if not os.path.exists(root):
+            os.makedirs(root)
+        from plotly.offline import get_plotlyjs
+        temp = f'{path}.{os.getpid()}.tmp'
+        with open(temp, 'w', encoding='utf-8') as f:
+            f.write(get_plotlyjs())
+        os.replace(temp, path)
+    return path
+
+
+def includePlotlyJs(mode, folder, root=units.RUN_FOLDER):
+    """
+    Value for plotly's include_plotlyjs: the whole bundle, a CDN link, or a relative path to the shared asset.
+    """
+    assert mode in OUTPUT_MODES, f'Output mode must be one of the following: {OUTPUT_MODES}'
+    if mode == 'embed':
+        return True
+    if mode == 'cdn':
+        return 'cdn'
+    return os.path.relpath(sharedPlotlyJs(root), folder).replace(os.sep, '/')
+
+
+def _jsonDefault(value):
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f'{type(value).__name__} is not JSON serializable')
+
+
+# escapes plotly applies to its JSON so text like '</script>' in a title can't end the <script> it's embedded in
+_UNSAFE = [('<', '\\u003c'), ('>', '\\u003e'), ('/', '\\u002f'), ('\u2028', '\\u2028'), ('\u2029', '\\u2029')]
+
+
+def toJson(value):
+    """
+    JSON text of part of a figure dict. orjson encodes numeric arrays natively and string arrays in one pass,
+    where plotly's own encoder walks them element by element in Python. Escaped like plotly's, safe inside <script>.
+    """
+    if orjson is None:
+        from plotly.io.json import to_json_plotly
+        return to_json_plotly(value)
+    text = orjson.dumps(value, default=_jsonDefault, option=orjson.OPT_SERIALIZE_NUMPY).decode()
+    for unsafe, escaped in _UNSAFE:
+        if unsafe in text:
+            text = text.replace(unsafe, escaped)
+    return text
+
+
+def _size(value, default):
+    return f'{value}px' if isinstance(value, (int, float)) else default
+
+
+def figureDiv(fig):
+    """
+    The <div> and script drawing fig, as pio.to_html(full_html=False, include_plotlyjs=False) writes it.
+    """
+    figure = fig.to_dict()
+    layout = figure.get('layout', {})
+    divId = str(uuid.uuid4())
+    return (f'<div style="height:{_size(layout.get("height"), "100%")}; width:{_size(layout.get("width"), "100%")};">'
+            f'<div id="{divId}" class="plotly-graph-div" style="height:100%; width:100%;"></div>'
+            f'<script type="text/javascript">window.PLOTLYENV=window.PLOTLYENV || {{}};'
+            f'if (document.getElementById("{divId}")) {{Plotly.newPlot("{divId}", {toJson(figure.get("data", []))}, '
+            f'{toJson(layout)}, {{"responsive": true}})}};</script></div>')
+
+
+def scriptTag(include):
+    """
+    The <script> loading plotly.js for an includePlotlyJs value.
+    """
+    if include is True:
+        from plotly.offline import get_plotlyjs
+        return f'<script type="text/javascript">{get_plotlyjs()}</script>'
+    if include == 'cdn':
+        return f'<script src="https://cdn.plot.ly/plotly-{plotly.__version__}.min.js"></script>'
+    return f'<script src="{html.escape(include)}"></script>'
+
+
+def writePage(path, title, body, include=True):
+    page = (f'<!DOCTYPE html>\n<html>\n<head><meta charset="utf-8"/><title>{html.escape(title)}</title>'
+            f'<style>html, body {{height: 100%;}}</style>{scriptTag(include)}</head>\n<body>\n{body}\n</body>\n</html>\n')
+    temp = f'{path}.{os.getpid()}.tmp'
+    with open(temp, 'w', encoding='utf-8') as f:
+        f.write(page)
+    os.replace(temp, path)
+    return path
+
+
+class FigureWriter:
+    """
+    Writes a run's figures either as one HTML file per figure or as a single dashboard page.
+
+    render() does the work for one figure and keeps no state, so figures can be rendered on other processes and
+    their results handed to collect(); add() does both.
+    """
+
+    def __init__(self, folder, name, mode=units.OUTPUT_MODE, dashboard=False, root=units.RUN_FOLDER):
+        self.folder = folder
+        self.name = name
+        self.dashboard = dashboard
+        self.include = includePlotlyJs(mode, folder, root)
+        self.figures = []
+        self.written = []
+        if not os.path.exists(folder):
+            os.makedirs(folder)
+
+    def render(self, fig, kind):
+        """
+        The dashboard section of fig, or the path of its page once written.
+        """
+        if self.dashboard:
+            return figureDiv(fig)
+        path = os.path.join(self.folder, f'{self.name}_{kind}{units.EXTENSION}')
+        return writePage(path, f'{self.name} {kind}', figureDiv(fig), self.include)
+
+    def collect(self, kind, result):
+        if self.dashboard:
+            self.figures.append((kind, result))
+            return
+        self.written.append(result)
+        return result
+
+    def add(self, fig, kind):
+        return self.collect(kind, self.render(fig, kind))
+
+    def close(self):
+        if self.dashboard and self.figures:
+            path = os.path.join(self.folder, f'{self.name}_dashboard{units.EXTENSION}')
+            writeDashboard(self.figures, path, self.name, self.include)
+            self.written.append(path)
+        return self.written
+
+
+def writeDashboard(sections, path, title, include=True):
+    """
+    One page holding every (kind, figureDiv) pair, with plotly.js loaded once.
+    """
+    body = f'<h1>{html.escape(title)}</h1>\n' + '\n'.join(
+        f'<section id="{kind}">{section}</section>' for kind, section in sections)
+    return writePage(path, title, body, include)
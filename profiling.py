@@ -0,0 +1,132 @@
+import cProfile
+import json
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+
+class Profiler:
+    """
+    Wall-clock time, peak traced memory and HTTP request count per named stage.
+
+    Stages with the same name accumulate. Every finished stage is passed to each hook as a dict
+    ({'stage', 'seconds', 'peak_bytes', 'requests', **labels}), which is how timings reach a metrics pipeline.
+    """
+
+    def __init__(self, hooks=(), memory=True, labels=None):
+        self.hooks = list(hooks)
+        self.memory = memory
+        self.labels = labels or {}
+        self.stages = {}
+        self.requests = 0
+        self.profile = None
+
+    @contextmanager
+    def stage(self, name):
+        # stages are not meant to be nested: an inner stage resets the traced memory peak
+        requests = self.requests
+        if self.memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+            tracemalloc.reset_peak()
+            baseline = tracemalloc.get_traced_memory()[0]
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            peak = tracemalloc.get_traced_memory()[1] - baseline if self.memory else 0
+            self.record(name, seconds, peak, self.requests - requests)
+
+    def record(self, name, seconds, peak=0, requests=0):
+        totals = self.stages.setdefault(name, {'seconds': 0.0, 'peak_bytes': 0, 'requests': 0, 'calls': 0})
+        totals['seconds'] += seconds
+        totals['peak_bytes'] = max(totals['peak_bytes'], peak)
+        totals['requests'] += requests
+        totals['calls'] += 1
+        event = {'stage': name, 'seconds': seconds, 'peak_bytes': peak, 'requests': requests, **self.labels}
+        for hook in self.hooks:
+            hook(event)
+
+    def countResponse(self, response, *args, **kwargs):
+        self.requests += 1
+        return response
+
+    def watch(self, client):
+        """
+        Count every HTTP response received through client's requests session (a stravalib Client or a Session).
+        """
+        session = getattr(getattr(client, 'protocol', None), 'rsession', None) or client
+        hooks = getattr(session, 'hooks', None)
+        if hooks is not None and self.countResponse not in hooks['response']:
+            hooks['response'].append(self.countResponse)
+        return client
+
+    def unwatch(self, client):
+        session = getattr(getattr(client, 'protocol', None), 'rsession', None) or client
+        hooks = getattr(session, 'hooks', None)
+        if hooks is not None and self.countResponse in hooks['response']:
+            hooks['response'].remove(self.countResponse)
+
+    def startProfile(self):
+        self.profile = cProfile.Profile()
+        self.profile.enable()
+
+    def stopProfile(self, path):
+        self.profile.disable()
+        self.profile.dump_stats(path)
+        self.profile = None
+
+    def totals(self):
+        return {'stages': self.stages, 'requests': self.requests}
+
+    def merge(self, totals):
+        """
+        Add the totals() of another profiler, e.g. one that ran in a batch worker.
+        """
+        for name, stage in totals['stages'].items():
+            mine = self.stages.setdefault(name, {'seconds': 0.0, 'peak_bytes': 0, 'requests': 0, 'calls': 0})
+            mine['seconds'] += stage['seconds']
+            mine['peak_bytes'] = max(mine['peak_bytes'], stage['peak_bytes'])
+            mine['requests'] += stage['requests']
+            mine['calls'] += stage['calls']
+        self.requests += totals['requests']
+
+    def report(self):
+        total = sum(stage['seconds'] for stage in self.stages.values()) or 1
+        lines = [f"{'stage':<16}{'calls':>7}{'seconds':>11}{'share':>8}{'peak MB':>10}{'requests':>10}"]
+        for name, stage in self.stages.items():
+            lines.append(f"{name:<16}{stage['calls']:>7}{stage['seconds']:>11.3f}{stage['seconds'] / total:>8.1%}"
+                         f"{stage['peak_bytes'] / 2 ** 20:>10.1f}{stage['requests']:>10}")
+        lines.append(f'Network requests: {self.requests}')
+        return '\n'.join(lines)
+
+
+class NullProfiler(Profiler):
+    """
+    Stands in when profiling is off; stages cost a context manager and nothing else.
+    """
+
+    def __init__(self):
+        super().__init__(memory=False)
+
+    @contextmanager
+    def stage(self, name):
+        yield
+
+    def watch(self, client):
+        return client
+
+
+class JsonLinesHook:
+    """
+    Appends every stage event as one JSON line, for shipping to a metrics pipeline. Picklable, so it can be
+    handed to batch workers.
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def __call__(self, event):
+        with open(self.path, 'a') as f:
+            f.write(json.dumps(event) + '\n')
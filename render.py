@@ -0,0 +1,160 @@
+import os.path
+import threading
+import numpy as np
+import analysis
+import export
+import signals
+import units
+from analysis import analyzeRun, runFrame, writeAnalysis
+from figures import FIGURES, figureContext, figureVersion, renderFigures
+from functions import get_activity_streams, readCredentials, setUpClient
+from HRZone import getAthleteZones
+from manifest import Manifest, digest, sourceVersion
+from offline import RecordingClient, ReplayClient
+from output import FigureWriter
+from profiling import NullProfiler
+from store import ActivityStore
+from streams import StreamCache
+
+
+def selectRun(client, rowId, sync=True, full=False, activityId=None):
+    with ActivityStore() as store:
+        if activityId is not None:
+            if sync:
+                # newer activities only, the whole history just when the run isn't stored yet
+                store.sync(client, full=full, need=0)
+                if not store.has(activityId):
+                    store.sync(client)
+            return store.getActivity(activityId)
+        if sync:
+            # stops listing once rowId exists, a recent run costs a single page
+            store.sync(client, full=full, need=rowId + 1)
+        return store.getRun(rowId)
+
+
+def artifactKeys(inputs, output, dashboard, points, method):
+    """
+    {artifact: key} for every output of a run: one per figure kind (or the dashboard), the analysis and,
+    with pyarrow installed, the Parquet export.
+    """
+    frame = sourceVersion(runFrame, signals)
+    options = [output, points, method]
+    if dashboard:
+        keys = {'dashboard': digest(inputs, frame, options, [figureVersion(kind) for kind in FIGURES])}
+    else:
+        keys = {kind: digest(inputs, frame, options, figureVersion(kind)) for kind in FIGURES}
+    keys['analysis'] = digest(inputs, frame, sourceVersion(analysis))
+    if export.available():
+        keys['export'] = digest(inputs, frame, sourceVersion(export), export.pyarrow.__version__)
+    return keys
+
+
+def makePlots(client, rowId, sync=True, full=False, output=units.OUTPUT_MODE, dashboard=False,
+              points=units.PLOT_POINTS, method=units.DOWNSAMPLING, profiler=NullProfiler(), activityId=None,
+              force=False, resolution=units.RESOLUTION, figureWorkers=units.FIGURE_WORKERS):
+    """
+    Plots and analysis for the run at rowId (0 is the most recent), or for the Strava activityId if given,
+    from streams at the given Strava resolution. Figures are built and written on figureWorkers processes.
+
+    Outputs whose inputs (streams, zones, run name, options) and code are unchanged since the last render,
+    as recorded in the run's manifest, are skipped unless force is set. Returns the artifacts rebuilt.
+    """
+    profiler.watch(client)
+    with profiler.stage('activities'):
+        things = selectRun(client, rowId, sync, full, activityId)
+    activityId = things['id']
+    name = things['name']
+    print(f'Looking at', name)
+    with profiler.stage('streams'):
+        hr, pace, elevation, timeIdx, distanceIdx = get_activity_streams(client, activityId, resolution=resolution)
+    with profiler.stage('athlete_zones'):
+        values = getAthleteZones(client)
+
+    with profiler.stage('manifest'):
+        folder = os.path.join(units.RUN_FOLDER, name)
+        manifest = Manifest(folder)
+        streams = [np.asarray(s) if s is not None else None for s in (hr, pace, elevation, timeIdx, distanceIdx)]
+        keys = artifactKeys(digest(int(activityId), name, values, *streams), output, dashboard, points, method)
+        stale = manifest.stale(keys, force)
+    if not stale:
+        print('Up to date')
+        return stale
+
+    data = runFrame(hr, pace, elevation, timeIdx, distanceIdx, values, profiler)
+
+    kinds = list(FIGURES) if 'dashboard' in stale else [kind for kind in stale if kind in FIGURES]
+    rendered = []
+    if 'analysis' in stale:
+        with profiler.stage('aggregation'):
+            summary, report = analyzeRun(data, activityId, name)
+    writer = FigureWriter(os.path.join(folder, units.PLOT_FOLDER), name, mode=output, dashboard=dashboard)
+    if kinds:
+        with profiler.stage('figures'):
+            # figures get a shape-preserving subset, the analysis keeps every sample; each figure file is
+            # written by the task that built it
+            rendered = renderFigures(figureContext(data, name, points, method), kinds, writer, figureWorkers)
+    with profiler.stage('write'):
+        if dashboard and rendered:
+            manifest.record('dashboard', keys['dashboard'], writer.close(), resolution)
+        elif rendered:
+            for kind, path in rendered:
+                manifest.record(kind, keys[kind], [path], resolution)
+        if 'analysis' in stale:
+            paths = writeAnalysis(os.path.join(folder, units.ANALYSIS_FOLDER), name, summary, report)
+            manifest.record('analysis', keys['analysis'], paths, resolution)
+        if 'export' in stale:
+            paths = export.writeExport(os.path.join(folder, units.EXPORT_FOLDER), name, data, activityId,
+                                       things['start_date'])
+            manifest.record('export', keys['export'], paths, resolution)
+        manifest.save()
+    return stale
+
+
+def previewPlots(client, rowId, sync=True, full=False, profiler=NullProfiler(), activityId=None,
+                 resolution=units.RESOLUTION, preview=units.PREVIEW_RESOLUTION, upgrade=True, **renderOptions):
+    """
+    makePlots from the smaller preview streams first, then again at resolution on a background thread that
+    replaces the preview outputs when it finishes. Returns that thread, or None when no upgrade was needed:
+    runs whose full streams are already cached are rendered at resolution straight away.
+    """
+    with profiler.stage('activities'):
+        activityId = int(selectRun(client, rowId, sync, full, activityId)['id'])
+    finer = units.RESOLUTIONS.index(resolution) > units.RESOLUTIONS.index(preview)
+    if not finer or StreamCache().contains(activityId, resolution):
+        makePlots(client, None, sync=False, profiler=profiler, activityId=activityId, resolution=resolution,
+                  **renderOptions)
+        return None
+    makePlots(client, None, sync=False, profiler=profiler, activityId=activityId, resolution=preview, **renderOptions)
+    if not upgrade:
+        return None
+    print(f'Preview written from {preview} resolution streams, upgrading to {resolution} in the background')
+    # not a daemon: the process waits for the upgrade before exiting. Its figures are rendered serially, forking
+    # from a thread isn't safe
+    thread = threading.Thread(target=makePlots, args=(client, None),
+                              kwargs=dict(renderOptions, sync=False, activityId=activityId, resolution=resolution,
+                                          figureWorkers=1),
+                              name=f'upgrade-{activityId}')
+    thread.start()
+    return thread
+
+
+def openClient(offline=False, record=False, profiler=NullProfiler()):
+    """
+    The live client, the live client recording into units.FIXTURES, or a replay of those recordings.
+    """
+    if offline:
+        with profiler.stage('client'):
+            return ReplayClient()
+    with profiler.stage('credentials'):
+        CLIENT_ID, CLIENT_SECRET = readCredentials('credentials.txt')
+    with profiler.stage('client'):
+        my_client = setUpClient(CLIENT_ID, CLIENT_SECRET)
+    return RecordingClient(my_client) if record else my_client
+
+
+def main(rowId, sync=True, full=False, profiler=NullProfiler(), offline=False, record=False, preview=False,
+         **renderOptions):
+    my_client = openClient(offline, record, profiler)
+    if preview:
+        return previewPlots(my_client, rowId, sync=sync, full=full, profiler=profiler, **renderOptions)
+    makePlots(my_client, rowId, sync=sync, full=full, profiler=profiler, **renderOptions)
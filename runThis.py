@@ -1,384 +1,321 @@
-import datetime
-import os.path
+import argparse
 import sys
 import warnings
-import plotly.express as px
-import plotly.graph_objects as go
-import plotly.io as pio
-import pytz
 import units
-from Pace import Pace
-from functions import *
-from units import *
+from selection import localDate, selectionFromArgs, selectionOptions, selectRuns
+from store import ActivityStore
 
 warnings.filterwarnings('ignore')
 
-def setUpClient(client_id, client_secret):
-    client = Client()
-    if os.path.exists(PKL):
-        with open(PKL, 'rb') as f:
-            client = pickle.load(f)
-            try:
-                client.get_athlete()
-                print('Client works')
-                return client
-            except:
-                pass
+# heavy modules (pandas, plotly, stravalib) are imported inside the commands that use them
+COMMANDS = ['list', 'render', 'sync', 'stats', 'history', 'efforts', 'serve', 'export', 'team']
 
-    try:
-        authorize_url = client.authorization_url(client_id=client_id,
-                                             redirect_uri='http://localhost:1127/authorized',
-                                             scope=['read_all', 'profile:read_all', 'activity:read_all'])
-    except:
-        print('Invalid client credentials.txt')
-        return
 
-    webbrowser.open(authorize_url)
-    code = input("Code: ")
-    code = code.strip()
-    tokenStuff = client.exchange_code_for_token(client_id=client_id, client_secret=client_secret, code=code)
-
-    access = tokenStuff['access_token']
-    client.access_token = access
-    print('Client access token assigned')
-    with open(PKL, 'wb') as f:
-        pickle.dump(client, f)
-
-    # get client expiration time
-    expTime = tokenStuff['expires_at']
-    exp_datetime = datetime.datetime.fromtimestamp(expTime)
-    print(exp_datetime)
-    exp_datetime = exp_datetime.replace(tzinfo=pytz.utc)
-    timezone = datetime.datetime.now().astimezone().tzinfo
-    exp_datetime = exp_datetime.astimezone(timezone)
-
-    # convert to 12-hour time
-    exp_datetime = exp_datetime.strftime('%b %d, %Y %I:%M %p')
-    print(f'Token expires at {exp_datetime} {timezone}')
-
-    return client
-
-
-def getActivities(client):
-    activities = client.get_activities()
-    activity_list = []
-    for activity in activities:
-        activity_dict = {
-            'id': activity.id,
-            'name': activity.name,
-            'start_date': activity.start_date,
-            'distance': activity.distance,  # Convert distance to numeric (meters)
-            'moving_time': activity.moving_time,  # Convert to seconds
-            'elapsed_time': activity.elapsed_time,  # Convert to seconds
-            'total_elevation_gain': activity.total_elevation_gain,
-            'type': activity.type,
-            'average_speed': activity.average_speed if activity.average_speed else None,  # Convert to numeric
-            'max_speed': activity.max_speed if activity.max_speed else None,  # Convert to numeric
-            'average_heartrate': activity.average_heartrate,
-            'max_heartrate': activity.max_heartrate,
-        }
-        activity_list.append(activity_dict)
-    myActivities = pd.DataFrame(activity_list)
-    myActivities = myActivities[myActivities['type'].astype(str).apply(lambda x: 'Run' in x)]
-    myActivities = myActivities.reset_index(drop=True)
-    myActivities.to_csv('myActivities.csv')
-    return myActivities
-
-
-def get_activity_streams(client, activity_id, resolution='high'):
+def rowRange(text):
     """
-    Fetch heart rate, pace (velocity), and elevation streams for a given activity ID.
+    argparse type for --range: the 0-based rowIds of a 1-based FIRST-LAST range.
     """
-    streams = client.get_activity_streams(
-        activity_id,
-        types=['heartrate', 'velocity_smooth', 'altitude', 'time', 'distance'],
-        resolution=resolution,
-    )
-
-    heart_rate = streams['heartrate'].data if 'heartrate' in streams else None
-    velocity = streams['velocity_smooth'].data if 'velocity_smooth' in streams else None
-    elevation = streams['altitude'].data if 'altitude' in streams else None
-    time_index = streams['time'].data if 'time' in streams else None
-    distance_index = streams['distance'].data if 'distance' in streams else None
-    return heart_rate, velocity, elevation, time_index, distance_index
-
-
-def makePlots(client, rowId):
-    myActivities = getActivities(client)
-    assert 0 <= rowId < len(myActivities), 'Invalid rowId'
-    things = myActivities.iloc[rowId]
-    activityId = things['id']
-    name = things['name']
-    print(f'Looking at', name)
-    hr, pace, elevation, timeIdx, distanceIdx = get_activity_streams(client, activityId, resolution='high')
-
-    # Convert to imperial system
-    elevation = [int(round(metersToFeet(elev), 0)) for elev in elevation]
-    timeIdx = [i / 60 for i in timeIdx]
-    distanceIdx = [round(metersToMiles(i), 2) for i in distanceIdx]
-
-    pace = [Pace.from_mps(v) for v in pace if v > 0]
-
-    """Pace Plots"""
-    # Time
-    diff = len(timeIdx) - len(pace)
-    average = sum(pace) / len(pace)
-    x = pace + [average] * diff
-
-    stuff = numericPlot('Pace', x, timeIdx, distanceIdx)
-    myPaces = stuff['Pace']
-    index = stuff['Time']
-
-    y_values = [pace.time/60 for pace in myPaces]
-    labels = [str(pace) for pace in myPaces]
-
-    # Create the plot
-    fig = go.Figure(data=go.Scatter(
-        x=index,
-        y=y_values,
-        mode='markers+lines',
-        text=[f"{str(pace)}, {hr[i]} BPM" for i, pace in enumerate(myPaces)],
-        marker=dict(color=hr, colorscale='solar', colorbar=dict(title='Heart Rate'))
-    ))
-
-    fig.update_layout(
-        title=f'Pace Plot: {name}',
-        xaxis_title='Time',
-        yaxis_title='Pace (min/mi)'
-    )
-    requiredFolders = os.path.join(units.RUN_FOLDER, name, units.PLOT_FOLDER)
-    if not os.path.exists(requiredFolders):
-        os.makedirs(requiredFolders)
-
-    pio.write_html(fig, os.path.join(requiredFolders, f'{name}_pace_time{units.EXTENSION}'))
-
-    # Distance
-    index = stuff['Distance']
-    y_values = [pace.time / 60 for pace in myPaces]
-
-    fig = go.Figure(data=go.Scatter(
-        x=index,
-        y=y_values,
-        mode='markers+lines',
-        text=[f"{str(pace)}, {hr[i]} BPM" for i, pace in enumerate(myPaces)],
-        marker=dict(color=hr, colorscale='solar', colorbar=dict(title='Heart Rate'))
-    ))
-
-    fig.update_layout(
-        title='Pace Plot',
-        xaxis_title='Distance',
-        yaxis_title='Pace (min/mi)'
-    )
-
-    pio.write_html(fig, os.path.join(requiredFolders, f'{name}_pace_distance{units.EXTENSION}'))
-
-    """ HR """
-    # Time
-
-    zones = client.get_athlete_zones().dict()
-    values = zones['heart_rate']['zones'][:-1]
-    base = 'HR'
-    data = numericPlot(base, hr, timeIdx, distanceIdx)
+    from batch import parseRange
     try:
-        data['Zone']
-    except:
-        data['Zone'] = data[base].apply(lambda x: getZone(values, x))
-
-    zone_colors = {
-        'Endurance': 'green',
-        'Moderate': 'yellow',
-        'Tempo': 'orange',
-        'Threshold': 'red',
-        'Redline': 'black'
-    }
-
-    fig = go.Figure()
-    for zone in data['Zone'].unique():
-        zone_data = data[data['Zone'] == zone]
-        fig.add_trace(go.Scatter(
-            x=zone_data['Time'],
-            y=zone_data['HR'],
-            mode='lines',
-            name=zone,
-            line=dict(color=zone_colors[zone], width=1)  # Assign color based on zone
-        ))
-
-    fig.update_layout(
-        title=f'{base}: {name}',
-        xaxis_title='Time',
-        yaxis_title=base,
-        autosize=False,
-        width=800,
-        height=600
-    )
-
-    pio.write_html(fig, os.path.join(requiredFolders, f'{name}_hr_time{units.EXTENSION}'))
-
-    # Distance
-    fig = go.Figure()
-
-    # Add traces for each zone using Distance as the x-axis
-    for zone in data['Zone'].unique():
-        zone_data = data[data['Zone'] == zone]
-        fig.add_trace(go.Scatter(
-            x=zone_data['Distance'],
-            y=zone_data['HR'],
-            mode='lines',
-            name=zone,
-            line=dict(color=zone_colors[zone], width=1)  # Assign color based on zone
-        ))
-
-    fig.update_layout(
-        title=f'{base}: {name}',
-        xaxis_title='Distance',
-        yaxis_title=base,
-        autosize=False,
-        width=800,
-        height=600
-    )
-
-    pio.write_html(fig, os.path.join(requiredFolders, f'{name}_hr_distance{units.EXTENSION}'))
-
-    requiredAnalysisFolders = os.path.join(units.RUN_FOLDER, name, units.ANALYSIS_FOLDER)
-    if not os.path.exists(requiredAnalysisFolders):
-        os.makedirs(requiredAnalysisFolders)
-    analysisFile = os.path.join(requiredAnalysisFolders, f'{name}_analysis.txt')
-
-    open(analysisFile, 'w').close()
-    with open(analysisFile, 'w') as f:
-        data['Pace'] = x
-
-        grouped = data.groupby('Zone').mean()
-        minimums = data.groupby('Zone').min()
-        maximums = data.groupby('Zone').max()
-        minimums['Pace'] = minimums['Pace'].apply(lambda x: x.time).apply(lambda j: Pace.fromSeconds(j))
-        maximums['Pace'] = maximums['Pace'].apply(lambda x: x.time).apply(lambda j: Pace.fromSeconds(j))
-        for z in grouped.index:
-            item = f'{z} Average Pace: {Pace.fromSeconds(grouped.loc[z, "Pace"])}'
-            f.write(item + '\n')
-        f.write('\n\n')
-        for z in minimums.index:
-            item = f'{z} Range: {minimums.loc[z, "Pace"]} to {maximums.loc[z, "Pace"]}'
-            f.write(item + '\n')
-
-    """ Pace-HR Boxplot"""
-
-    data['PaceTime'] = data['Pace'].apply(lambda x: x.time/60)
-    data['PaceStr'] = data['Pace'].astype(str)
-
-    # Apply the outlier exclusion function to each zone
-    filtered_data = pd.concat([
-        exclude_outliers(data[data['Zone'] == zone], 'PaceTime')
-        for zone in data['Zone'].unique()
-    ])
-
-    # Create the boxplot
-    fig = go.Figure()
-    for zone in filtered_data['Zone'].unique():
-        zone_data = filtered_data[filtered_data['Zone'] == zone]
-        fig.add_trace(go.Box(
-            y=zone_data['PaceTime'],  # Numeric pace values for the boxplot
-            x=[zone] * len(zone_data),  # Use the zone as the x-axis category
-            name=zone,  # Name of the trace (zone)
-            text=zone_data['PaceStr'],  # Tooltip labels (string representation of pace)
-            hovertemplate='%{x}<br>Pace: %{text}<extra></extra>',  # Custom tooltip format
-            boxmean=True  # Show mean as a dashed line
-        ))
-
-    fig.update_layout(
-        title='Pace Distribution by Heart Rate Zone (Outliers Excluded)',
-        xaxis_title='Heart Rate Zone',
-        yaxis_title='Pace (min/mi)',
-        autosize=False,
-        width=800,
-        height=600
-    )
-
-    pio.write_html(fig, os.path.join(requiredFolders, f'{name}_pace_hr_boxplot{units.EXTENSION}'))
-
-    data = numericPlot('Elevation', elevation, timeIdx, distanceIdx)
-    fig = px.line(data, x='Time', y='Elevation', title=f'Elevation: {name}')
-    fig.update_layout(autosize=False, width=800, height=600)
-    pio.write_html(fig, os.path.join(requiredFolders, f'{name}_elevation_time_plot{units.EXTENSION}'))
-
-    fig = px.line(data, x='Distance', y='Elevation', title=f'Elevation: {name}')
-    fig.update_layout(autosize=False, width=800, height=600)
-    pio.write_html(fig, os.path.join(requiredFolders, f'{name}_elevation_distance_plot{units.EXTENSION}'))
-
-    data['Pace'] = x
-    data['HR'] = hr
-    data['PaceTime'] = data['Pace'].apply(lambda x: x.time)
-    data['PaceStr'] = data['Pace'].astype(str)
-
-    x = data[['HR', 'PaceTime']]
-    correlation = x.corr()['HR']['PaceTime']
-
-    elevationGradient = gradient(elevation)
-    hrGradient = gradient(hr)
-
-    data['Elevation Gradient'] = elevationGradient
-    data['HR Gradient'] = hrGradient
-
-    fig = px.scatter(data, x='HR Gradient', y='Elevation Gradient', title='Elevation Gradient')
-    pio.write_html(fig, os.path.join(requiredFolders, f'{name}_elevation_hr_gradient{units.EXTENSION}'))
-    elevationGain = data[data['Elevation Gradient'] > 0]['Elevation Gradient'].sum()
-    m = round(elevationGain/3.281, 0)
-    with open(analysisFile, 'a') as a:
-        a.write(f'\n\nCorrelation between Heart Rate and Pace = {float(correlation)}')
-        a.write(f'\nAverage Elevation Gradient = {data['Elevation Gradient'].mean()}')
-        a.write(f'\nAverage HR Gradient = {data['HR Gradient'].mean()}')
-        a.write(f'\nElevation Gain = {elevationGain} ft | {m} m')
-
-def getZone(values, hr):
-    n = len(values)
-    assert hr >= 0, 'HR must be non-negative'
-    for i in range(n):
-        bucket = values[i]
-        if bucket['min'] <= hr <= bucket['max']:
-            return units.HR_ZONES[i]
-    raise ValueError(f'HR {hr} is out of range')
-
-def numericPlot(base, items, timeIdx, distanceIdx):
-    data = pd.DataFrame({
-        base: items,
-        'Time': timeIdx,
-        'Distance': distanceIdx
-    })
-    return data
-
-def main(rowId):
-    CLIENT_ID, CLIENT_SECRET = readCredentials('credentials.txt')
-    my_client = setUpClient(CLIENT_ID, CLIENT_SECRET)
-    makePlots(my_client, rowId)
-
-def gradient(arr, gap=1):
-    slopes = []
-    for i in range(0, len(arr), gap):
-        if i == 0:
-            rise = i
-        else:
-            rise = arr[i] - arr[i-gap]
-        slopes.append(rise)
-    return slopes
-
-def parseRowId():
-    if len(sys.argv) > 1:
-        return int(sys.argv[1]), True
-    return units.DEFAULT_VALUE, False
+        return parseRange(text)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+
+def clientOptions(parser):
+    parser.add_argument('--resync', action='store_true', help='re-list the full activity history')
+    parser.add_argument('--record', action='store_true', help=f'save every API response under {units.FIXTURES}/')
+    parser.add_argument('--offline', action='store_true', help=f'replay the responses in {units.FIXTURES}/, no network')
 
-def starter(cont=False):
-    r, bool = parseRowId()
-    if bool:
-        main(r-1)
-    else:
-        main(r)
 
+def outputOptions(parser):
+    parser.add_argument('--plotlyjs', choices=units.OUTPUT_MODES, default=units.OUTPUT_MODE,
+                        help='embed plotly.js in every file, share one copy per output root, or load it from the CDN')
+    parser.add_argument('--dashboard', action='store_true', help="write one dashboard page per run instead of one file per figure")
+
+
+def parseArgs(argv=None):
+    """
+    Subcommand arguments. Without a subcommand the arguments are taken as the original render flags, so
+    `runThis.py 3` and `runThis.py --history` keep working.
+    """
+    argv = list(sys.argv[1:] if argv is None else argv)
+    if not argv or (argv[0] not in COMMANDS and argv[0] not in ['-h', '--help']):
+        argv = ['history'] + [a for a in argv if a != '--history'] if '--history' in argv else ['render'] + argv
+
+    parser = argparse.ArgumentParser(description='Generate interactive plots for Strava runs.')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    listing = commands.add_parser('list', help='list stored runs with their row numbers')
+    listing.add_argument('--limit', type=int, default=20, help='runs to show, 0 for all')
+    selectionOptions(listing)
+
+    render = commands.add_parser('render', help='render plots and analysis for one run or a range of runs')
+    render.add_argument('rowId', nargs='?', type=int, help='run number, 1 is the most recent run')
+    render.add_argument('--all', action='store_true', help='render every run')
+    render.add_argument('--range', dest='rowRange', type=rowRange, help='render a range of runs, e.g. 1-200')
+    render.add_argument('--workers', type=int, help='worker processes for --all/--range or several selected runs')
+    selectionOptions(render)
+    outputOptions(render)
+    render.add_argument('--points', type=int, default=units.PLOT_POINTS,
+                        help='target points per line plot, 0 plots every sample')
+    render.add_argument('--downsample', choices=units.DOWNSAMPLING_METHODS, default=units.DOWNSAMPLING,
+                        help='downsampling method')
+    render.add_argument('--resolution', choices=units.RESOLUTIONS, default=units.RESOLUTION,
+                        help='stream resolution to fetch and plot')
+    render.add_argument('--preview', action='store_true',
+                        help=f'render from {units.PREVIEW_RESOLUTION} resolution streams first, '
+                             f'then upgrade to --resolution in the background')
+    render.add_argument('--force', action='store_true', help='re-render outputs even if their inputs are unchanged')
+    render.add_argument('--profile', action='store_true', help='print time, peak memory and requests per stage')
+    render.add_argument('--profile-out', dest='profileOut', help='also dump cProfile stats to this file')
+    render.add_argument('--metrics', help='append per-stage timings as JSON lines to this file')
+    clientOptions(render)
+
+    sync = commands.add_parser('sync', help='pull new activities into the local store')
+    clientOptions(sync)
+
+    commands.add_parser('stats', help='yearly totals from the local store')
+
+    history = commands.add_parser('history', help='update and plot training history across all runs')
+    outputOptions(history)
+    clientOptions(history)
+
+    efforts = commands.add_parser('efforts', help='fastest 400m/1mi/5k/10k/half of every run and the all-time bests')
+    efforts.add_argument('--workers', type=int, help='worker processes for scanning new runs')
+    clientOptions(efforts)
+
+    exporting = commands.add_parser('export', help='add every run to the partitioned Parquet dataset')
+    exporting.add_argument('--force', action='store_true', help='rewrite runs that are already exported')
+    clientOptions(exporting)
+
+    team = commands.add_parser('team', help=f'sync and render runs for every athlete under {units.ATHLETES_FOLDER}/')
+    team.add_argument('names', nargs='*', help='athletes to process, all registered athletes by default')
+    team.add_argument('--add', metavar='NAME', help='register an athlete from --credentials and authorize them')
+    team.add_argument('--credentials', default='credentials.txt', help='credentials file for --add')
+    team.add_argument('--all', action='store_true', help="render every run instead of each athlete's latest")
+    team.add_argument('--range', dest='rowRange', type=rowRange, help='render a range of runs per athlete, e.g. 1-20')
+    team.add_argument('--workers', type=int, help='render worker processes shared by all athletes')
+    team.add_argument('--api', default=units.STRAVA_API, help='API base URL, e.g. a local stubApi.StubApi')
+    outputOptions(team)
+    team.add_argument('--force', action='store_true', help='re-render outputs even if their inputs are unchanged')
+
+    serve = commands.add_parser('serve', help='browse runs in a local dashboard, figures built on request')
+    serve.add_argument('--host', default=units.SERVE_HOST, help='address to listen on')
+    serve.add_argument('--port', type=int, default=units.SERVE_PORT, help='port to listen on')
+    clientOptions(serve)
+    return parser.parse_args(argv)
+
+
+def makeProfiler(args):
+    from profiling import JsonLinesHook, NullProfiler, Profiler
+    hooks = [JsonLinesHook(args.metrics)] if args.metrics else []
+    if args.profile or args.profileOut or hooks:
+        return Profiler(hooks)
+    return NullProfiler()
+
+
+def finishProfile(profiler, args):
+    if args.profileOut:
+        profiler.stopProfile(args.profileOut)
+        print(f'cProfile stats written to {args.profileOut}')
+    if args.profile:
+        print(profiler.report())
+
+
+def renderOptions(args):
+    return {'output': args.plotlyjs, 'dashboard': args.dashboard, 'points': args.points, 'method': args.downsample,
+            'force': args.force, 'resolution': args.resolution}
+
+
+def listCommand(args):
+    selection = selectionFromArgs(args)
+    with ActivityStore() as store:
+        rows = selectRuns(store, limit=args.limit or None, **(selection or {}))
+    if not rows:
+        print('No matching runs' if selection else 'No runs stored yet, run `runThis.py sync` first')
+    for number, (activityId, startDate, name, distance, movingTime, hr) in enumerate(rows, 1):
+        miles = (distance or 0) / 1000 / units.FACTOR
+        minutes = (movingTime or 0) // 60
+        # row numbers only mean something for the unfiltered list
+        row = '' if selection else f'{number:>4}  '
+        print(f'{row}{activityId:>12}  {localDate(startDate)}  {miles:>6.2f} {units.MILES}  '
+              f'{minutes // 60:>2}:{minutes % 60:02d}  {f"{hr:.0f} bpm" if hr else "":>7}  {name}')
+
+
+def statsCommand(args):
+    with ActivityStore() as store:
+        totals = store.totals()
+    print(f"{'year':<6}{'runs':>6}{'miles':>10}{'hours':>8}{'climb ft':>10}{'longest':>9}")
+    for year, runs, meters, seconds, climb, longest in totals:
+        print(f'{year:<6}{runs:>6}{(meters or 0) / 1000 / units.FACTOR:>10.1f}{(seconds or 0) / 3600:>8.1f}'
+              f'{(climb or 0) * 3.28084:>10.0f}{(longest or 0) / 1000 / units.FACTOR:>9.2f}')
+
+
+def syncCommand(args):
+    from render import openClient
+    my_client = openClient(args.offline, args.record)
+    with ActivityStore() as store:
+        written = store.sync(my_client, full=args.resync)
+        print(f'Synced {written} activities, {store.count()} runs stored')
+
+
+def batchStarter(args, activityIds=None, client=None):
+    from batch import renderBatch
+    from functions import readCredentials
+    from profiling import JsonLinesHook
+    from render import openClient
+    from tokens import TokenStore
+    unsupported = [flag for flag, value in [('--preview', args.preview), ('--profile-out', args.profileOut)] if value]
+    if unsupported:
+        sys.exit(f"{' and '.join(unsupported)} can't be used when rendering several runs")
+    my_client = client or openClient(args.offline, args.record)
+    tokens = None if args.offline else TokenStore(*readCredentials('credentials.txt'))
+    rowIds = args.rowRange
+    hooks = [JsonLinesHook(args.metrics)] if args.metrics else []
+    return renderBatch(my_client, rowIds, workers=args.workers, full=args.resync, profile=args.profile, hooks=hooks,
+                       tokens=tokens, activityIds=activityIds, **renderOptions(args))
+
+
+def selectedStarter(args, selection):
+    """
+    Render the runs picked by the selection options: one in this process, several as a batch.
+    """
+    from render import openClient
+    my_client = openClient(args.offline, args.record)
+    with ActivityStore() as store:
+        # sync first so a run uploaded since the last sync can be selected
+        store.sync(my_client, full=args.resync)
+        ids = [row[0] for row in selectRuns(store, **selection)]
+    if not ids:
+        print('No matching runs')
+    elif len(ids) == 1:
+        from render import main
+        profiler = makeProfiler(args)
+        if args.profileOut:
+            profiler.startProfile()
+        main(None, sync=False, profiler=profiler, offline=args.offline, record=args.record, activityId=ids[0],
+             preview=args.preview, **renderOptions(args))
+        finishProfile(profiler, args)
+    else:
+        batchStarter(args, ids, my_client)
+
+
+def historyStarter(args):
+    from history import writeHistory
+    from HRZone import getAthleteZones
+    from render import openClient
+    my_client = openClient(args.offline, args.record)
+    with ActivityStore() as store:
+        store.sync(my_client, full=args.resync)
+        zones = getAthleteZones(my_client)
+        writeHistory(store, zones, client=my_client, output=args.plotlyjs, dashboard=args.dashboard)
+
+
+def effortsCommand(args):
+    from efforts import BestEfforts
+    from render import openClient
+    my_client = openClient(args.offline, args.record)
+    with ActivityStore() as store:
+        store.sync(my_client, full=args.resync)
+        efforts = BestEfforts(store)
+        print(f'Scanned {efforts.update(my_client, workers=args.workers)} new runs')
+        print(efforts.report())
+
+
+def exportCommand(args):
+    import export
+    from HRZone import getAthleteZones
+    from render import openClient
+    if not export.available():
+        print('Exporting needs pyarrow: pip install pyarrow')
+        return
+    my_client = openClient(args.offline, args.record)
+    with ActivityStore() as store:
+        store.sync(my_client, full=args.resync)
+        zones = getAthleteZones(my_client)
+        print(f'Exported {export.exportHistory(store, zones, client=my_client, force=args.force)} runs')
+
+
+def teamCommand(args):
+    from team import Registry, TeamScheduler
+    registry = Registry()
+    if args.add:
+        registry.add(args.add, args.credentials)
+        return
+    athletes = registry.athletes(args.names)
+    if not athletes:
+        print('No athletes registered, add one with `runThis.py team --add NAME --credentials FILE`')
+        return
+    rowIds = None if args.all else args.rowRange or [0]
+    summary = TeamScheduler(athletes, baseUrl=args.api, workers=args.workers).run(
+        rowIds, output=args.plotlyjs, dashboard=args.dashboard, force=args.force)
+    for name, result in summary.items():
+        print(f"{name}: rendered {result['rendered']} runs with {result['requests']} requests")
+        for what, error in result['failures'].items():
+            print(f'  {what} failed: {error}')
+
+
+def serveCommand(args):
+    from functions import readCredentials
+    from render import openClient
+    from serve import serve
+    from tokens import TokenStore
+    my_client = openClient(args.offline, args.record)
+    # the server outlives the access token, it's refreshed before fetching streams
+    tokens = None if args.offline else TokenStore(*readCredentials('credentials.txt'))
+    serve(my_client, tokens, host=args.host, port=args.port, full=args.resync)
+
+
+def renderCommand(args, cont=False):
+    if args.all or args.rowRange:
+        batchStarter(args)
+        return
+    selection = selectionFromArgs(args)
+    if selection:
+        selectedStarter(args, selection)
+        return
+    from render import main
+
+    # rowId on the command line is 1-based, DEFAULT_VALUE is already a row index
+    r = args.rowId - 1 if args.rowId is not None else units.DEFAULT_VALUE
+    full = args.resync
+    options = renderOptions(args)
+    profiler = makeProfiler(args)
+    if args.profileOut:
+        profiler.startProfile()
+    main(r, full=full, profiler=profiler, offline=args.offline, record=args.record, preview=args.preview, **options)
+    finishProfile(profiler, args)
+
+    # the store was synced by the first call, later rows are read from disk
     while cont:
         try:
-            main(r)
             r += 1
+            main(r, sync=False, offline=args.offline, record=args.record, **options)
         except:
             break
 
+
+def starter(cont=False):
+    args = parseArgs()
+    if args.command == 'list':
+        listCommand(args)
+    elif args.command == 'stats':
+        statsCommand(args)
+    elif args.command == 'sync':
+        syncCommand(args)
+    elif args.command == 'history':
+        historyStarter(args)
+    elif args.command == 'efforts':
+        effortsCommand(args)
+    elif args.command == 'export':
+        exportCommand(args)
+    elif args.command == 'team':
+        teamCommand(args)
+    elif args.command == 'serve':
+        serveCommand(args)
+    else:
+        renderCommand(args, cont)
+
 if __name__ == '__main__':
-    starter()
\ No newline at end of file
+    starter()
@@ -0,0 +1,95 @@
+import datetime
+from store import RUN_FILTER
+
+SELECTED = ['id', 'start_date', 'name', 'distance', 'moving_time', 'average_heartrate']
+
+
+def _utc(moment):
+    return moment.astimezone(datetime.timezone.utc).isoformat()
+
+
+def localDate(startDate):
+    """
+    YYYY-MM-DD local date of a stored UTC start_date, the date --date selects it by.
+    """
+    return datetime.datetime.fromisoformat(startDate).astimezone().date().isoformat()
+
+
+def parseDate(text):
+    """
+    Local midnight of a YYYY-MM-DD date, as an aware datetime.
+    """
+    return datetime.datetime.strptime(text, '%Y-%m-%d').astimezone()
+
+
+def selectRuns(store, ids=None, date=None, after=None, before=None, name=None, minDistance=None, maxDistance=None,
+               minHr=None, maxHr=None, limit=None):
+    """
+    Runs matching every given condition, most recent first, as tuples of SELECTED.
+
+    ids are Strava activity ids; date, after and before are local dates (YYYY-MM-DD, before is exclusive);
+    name matches a case-insensitive substring; distances are meters and HR is the run's average heart rate.
+    Lookups by id, date and distance are answered from the store's indexes.
+    """
+    conditions = [RUN_FILTER]
+    params = []
+    if ids:
+        conditions.append(f'id IN ({", ".join("?" * len(ids))})')
+        params += [int(i) for i in ids]
+    if date:
+        after = before = None
+        start = parseDate(date)
+        conditions.append('start_date >= ? AND start_date < ?')
+        params += [_utc(start), _utc(start + datetime.timedelta(days=1))]
+    if after:
+        conditions.append('start_date >= ?')
+        params.append(_utc(parseDate(after)))
+    if before:
+        conditions.append('start_date < ?')
+        params.append(_utc(parseDate(before)))
+    if name:
+        conditions.append("name LIKE ? ESCAPE '\\'")
+        params.append('%' + name.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%')
+    for column, bound, operator in [('distance', minDistance, '>='), ('distance', maxDistance, '<='),
+                                    ('average_heartrate', minHr, '>='), ('average_heartrate', maxHr, '<=')]:
+        if bound is not None:
+            conditions.append(f'{column} {operator} ?')
+            params.append(bound)
+    query = f'SELECT {", ".join(SELECTED)} FROM activities WHERE {" AND ".join(conditions)} ' \
+            f'ORDER BY start_date DESC LIMIT ?'
+    return store.conn.execute(query, params + [-1 if limit is None else limit]).fetchall()
+
+
+def selectionOptions(parser):
+    """
+    Command-line options for selectRuns, shared by the list and render commands.
+    """
+    parser.add_argument('--id', dest='ids', type=int, nargs='+', help='Strava activity ids')
+    parser.add_argument('--date', help='runs on this local date, YYYY-MM-DD')
+    parser.add_argument('--after', help='runs on or after this date')
+    parser.add_argument('--before', help='runs before this date')
+    parser.add_argument('--name', help='runs whose name contains this text')
+    parser.add_argument('--min-miles', dest='minMiles', type=float, help='at least this many miles')
+    parser.add_argument('--max-miles', dest='maxMiles', type=float, help='at most this many miles')
+    parser.add_argument('--min-hr', dest='minHr', type=float, help='average heart rate at least this')
+    parser.add_argument('--max-hr', dest='maxHr', type=float, help='average heart rate at most this')
+
+
+def selectionFromArgs(args):
+    """
+    selectRuns keyword arguments from selectionOptions, or None when no option was given.
+    """
+    selection = {
+        'ids': args.ids,
+        'date': args.date,
+        'after': args.after,
+        'before': args.before,
+        'name': args.name,
+        'minDistance': args.minMiles * 1609.344 if args.minMiles is not None else None,
+        'maxDistance': args.maxMiles * 1609.344 if args.maxMiles is not None else None,
+        'minHr': args.minHr,
+        'maxHr': args.maxHr,
+    }
+    if all(value is None for value in selection.values()):
+        return None
+    return selection
@@ -0,0 +1,263 @@
+import html
+import json
+import re
+import threading
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+import units
+from analysis import analyzeRun, runFrame
+from figures import FIGURES, buildFigures, figureContext
+from functions import get_activity_streams
+from HRZone import getAthleteZones
+from output import sharedPlotlyJs, toJson
+from selection import SELECTED, localDate, selectRuns
+from store import ActivityStore
+from streams import StreamCache
+
+RUN_PATH = re.compile(r'^/api/runs/(\d+)(?:/([a-z_]+))?$')
+
+
+class LruCache:
+    """
+    Thread-safe least recently used cache bounded by the total size of its values, as measured by sizeOf.
+    """
+
+    def __init__(self, maxBytes, sizeOf=len):
+        self.maxBytes = maxBytes
+        self.sizeOf = sizeOf
+        self.entries = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            if key not in self.entries:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return self.entries[key][0]
+
+    def put(self, key, value):
+        size = self.sizeOf(value)
+        with self.lock:
+            if key in self.entries:
+                self.bytes -= self.entries.pop(key)[1]
+            self.entries[key] = (value, size)
+            self.bytes += size
+            # the newest entry is kept even when it alone is over the limit
+            while self.bytes > self.maxBytes and len(self.entries) > 1:
+                self.bytes -= self.entries.popitem(last=False)[1][1]
+        return value
+
+    def stats(self):
+        return {'entries': len(self.entries), 'bytes': self.bytes, 'hits': self.hits, 'misses': self.misses}
+
+
+def frameSize(entry):
+    data, _ = entry
+    return int(data.memory_usage(deep=False).sum())
+
+
+class Dashboard:
+    """
+    What the server keeps warm between requests: the client, the athlete's zones, the stored run list, run frames
+    built from recently viewed streams, and the JSON of recently built figures.
+    """
+
+    def __init__(self, client, tokens=None, frameLimit=units.FRAME_CACHE_BYTES, figureLimit=units.FIGURE_CACHE_BYTES):
+        self.client = client
+        self.tokens = tokens
+        self.cache = StreamCache()
+        self.frames = LruCache(frameLimit, frameSize)
+        # figure and summary JSON, ready to send
+        self.figures = LruCache(figureLimit)
+        # one request at a time through the client, its HTTP session isn't shared safely between threads
+        self.clientLock = threading.Lock()
+        with self.clientLock:
+            self.zones = getAthleteZones(client)
+        self.runs = []
+        self.byId = {}
+
+    def sync(self, full=False):
+        with self.clientLock:
+            with ActivityStore() as store:
+                store.sync(self.client, full=full)
+                rows = selectRuns(store)
+        self.runs = [dict(zip(SELECTED, row)) for row in rows]
+        self.byId = {run['id']: run for run in self.runs}
+        return len(self.runs)
+
+    def frame(self, activityId, resolution=units.RESOLUTION):
+        """
+        (run frame, name) for a stored run, from memory when it was viewed recently.
+        """
+        key = (activityId, resolution)
+        entry = self.frames.get(key)
+        if entry is None:
+            with self.clientLock:
+                if self.tokens is not None and not self.cache.contains(activityId, resolution):
+                    self.tokens.authorize(self.client)
+                streams = get_activity_streams(self.client, activityId, resolution, cache=self.cache)
+            entry = self.frames.put(key, (runFrame(*streams, self.zones), self.byId[activityId]['name']))
+        return entry
+
+    def figure(self, activityId, kind, points=units.PLOT_POINTS, method=units.DOWNSAMPLING,
+               resolution=units.RESOLUTION):
+        """
+        Plotly JSON of one figure kind for a run.
+        """
+        key = (activityId, kind, points, method, resolution)
+        payload = self.figures.get(key)
+        if payload is None:
+            data, name = self.frame(activityId, resolution)
+            [(_, fig)] = buildFigures(figureContext(data, name, points, method), [kind])
+            payload = self.figures.put(key, toJson(fig.to_dict()).encode())
+        return payload
+
+    def summary(self, activityId, resolution=units.RESOLUTION):
+        """
+        JSON of a run's analysis summary and report, its stored metadata and the figure kinds to request.
+        """
+        key = (activityId, 'summary', resolution)
+        payload = self.figures.get(key)
+        if payload is None:
+            data, name = self.frame(activityId, resolution)
+            summary, report = analyzeRun(data, activityId, name)
+            body = {**summary, 'report': report, 'kinds': list(FIGURES), 'run': self.byId[activityId]}
+            payload = self.figures.put(key, json.dumps(body, default=str).encode())
+        return payload
+
+    def stats(self):
+        return {'runs': len(self.runs), 'frames': self.frames.stats(), 'figures': self.figures.stats(),
+                'streams': self.cache.stats()}
+
+
+PAGE = """<!DOCTYPE html>
+<html>
+<head><meta charset="utf-8"/><title>Runs</title><script src="/plotly.js"></script>
+<style>
+body {{ font-family: sans-serif; margin: 0; display: flex; }}
+nav {{ width: 22em; height: 100vh; overflow-y: auto; border-right: 1px solid #ccc; }}
+nav a {{ display: block; padding: .3em .6em; color: inherit; text-decoration: none; }}
+nav a:hover {{ background: #eee; }}
+main {{ flex: 1; height: 100vh; overflow-y: auto; padding: 0 1em; }}
+</style>
+</head>
+<body>
+<nav>{links}</nav>
+<main><h1 id="title">Pick a run</h1><pre id="report"></pre><div id="figures"></div></main>
+<script>
+async function show(id) {{
+  const run = await (await fetch(`/api/runs/${{id}}`)).json();
+  document.getElementById('title').textContent = run.name;
+  document.getElementById('report').textContent = run.report;
+  const figures = document.getElementById('figures');
+  figures.innerHTML = '';
+  for (const kind of run.kinds) {{
+    const div = document.createElement('div');
+    figures.appendChild(div);
+    fetch(`/api/runs/${{id}}/${{kind}}`).then(r => r.json()).then(fig => Plotly.newPlot(div, fig.data, fig.layout));
+  }}
+}}
+</script>
+</body>
+</html>
+"""
+
+
+def indexPage(runs):
+    links = ''.join(
+        f'<a href="#" onclick="show({run["id"]}); return false">{localDate(run["start_date"])} '
+        f'{(run["distance"] or 0) / 1000 / units.FACTOR:.1f} {units.MILES} {html.escape(run["name"] or "")}</a>'
+        for run in runs
+    )
+    return PAGE.format(links=links).encode()
+
+
+def makeServer(dashboard, host=units.SERVE_HOST, port=units.SERVE_PORT):
+    """
+    ThreadingHTTPServer for a Dashboard:
+
+    GET /                       page listing the runs, figures drawn in the browser by plotly.js
+    GET /api/runs               stored runs, most recent first
+    GET /api/runs/<id>          analysis summary, report and figure kinds of a run
+    GET /api/runs/<id>/<kind>   plotly figure JSON; points, method and resolution may be given as query parameters
+    GET /api/stats              cache sizes and hit counts
+    POST /api/sync              pull new activities into the store and the run list
+    """
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            url = urlparse(self.path)
+            query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+            try:
+                if url.path == '/':
+                    return self.reply(200, indexPage(dashboard.runs), 'text/html; charset=utf-8')
+                if url.path == '/plotly.js':
+                    with open(sharedPlotlyJs(), 'rb') as f:
+                        return self.reply(200, f.read(), 'application/javascript')
+                if url.path == '/api/runs':
+                    return self.json(200, dashboard.runs)
+                if url.path == '/api/stats':
+                    return self.json(200, dashboard.stats())
+                match = RUN_PATH.match(url.path)
+                if not match or int(match.group(1)) not in dashboard.byId:
+                    return self.json(404, {'message': 'Not found'})
+                activityId, kind = int(match.group(1)), match.group(2)
+                resolution = query.get('resolution', units.RESOLUTION)
+                if resolution not in units.RESOLUTIONS:
+                    return self.json(400, {'message': f'resolution must be one of {units.RESOLUTIONS}'})
+                if kind is None:
+                    return self.reply(200, dashboard.summary(activityId, resolution), 'application/json')
+                if kind not in FIGURES:
+                    return self.json(404, {'message': f'Unknown figure {kind}'})
+                method = query.get('method', units.DOWNSAMPLING)
+                if method not in units.DOWNSAMPLING_METHODS:
+                    return self.json(400, {'message': f'method must be one of {units.DOWNSAMPLING_METHODS}'})
+                points = query.get('points', str(units.PLOT_POINTS))
+                if not points.isdecimal():
+                    return self.json(400, {'message': 'points must be a non-negative integer'})
+                points = int(points)
+                self.reply(200, dashboard.figure(activityId, kind, points, method, resolution), 'application/json')
+            except Exception as e:
+                self.json(500, {'message': f'{type(e).__name__}: {e}'})
+
+        def do_POST(self):
+            if urlparse(self.path).path != '/api/sync':
+                return self.json(404, {'message': 'Not found'})
+            self.json(200, {'runs': dashboard.sync()})
+
+        def json(self, status, body):
+            self.reply(status, json.dumps(body, default=str).encode(), 'application/json')
+
+        def reply(self, status, payload, contentType):
+            self.send_response(status)
+            self.send_header('Content-Type', contentType)
+            self.send_header('Content-Length', str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, *args):
+            pass
+
+    return ThreadingHTTPServer((host, port), Handler)
+
+
+def serve(client, tokens=None, host=units.SERVE_HOST, port=units.SERVE_PORT, full=False):
+    """
+    Sync once, then answer requests until interrupted.
+    """
+    dashboard = Dashboard(client, tokens)
+    print(f'{dashboard.sync(full)} runs stored')
+    server = makeServer(dashboard, host, port)
+    print(f'Serving on http://{host}:{server.server_address[1]}/ (Ctrl+C to stop)')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
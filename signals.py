@@ -0,0 +1,122 @@
+import numpy as np
+from units import ELEVATION_SMOOTHING, ELEVATION_THRESHOLD, GRADE_SPAN, MAX_GRADE
+
+# Minetti et al. (2002) energy cost of running at grade i (J/kg/m), highest power first for np.polyval
+MINETTI = [155.4, -30.4, -43.3, 46.3, 19.5, 3.6]
+MINETTI_FLAT = MINETTI[-1]
+
+
+def _window(n, half):
+    """
+    Start and end (exclusive) of a centered window of half samples either side, clamped at the edges.
+    """
+    index = np.arange(n)
+    return np.maximum(index - half, 0), np.minimum(index + half + 1, n)
+
+
+def difference(values, gap=1):
+    """
+    First differences of every gap-th sample, 0 for the first one.
+    """
+    values = np.asarray(values)[::gap]
+    return np.diff(values, prepend=values[:1])
+
+
+def smooth(values, window=ELEVATION_SMOOTHING):
+    """
+    Centered moving average over window samples; the window shrinks at both ends instead of padding.
+    """
+    values = np.asarray(values, dtype=float)
+    if window <= 1 or not len(values):
+        return values
+    sums = np.concatenate([[0.0], np.cumsum(values)])
+    start, end = _window(len(values), window // 2)
+    return (sums[end] - sums[start]) / (end - start)
+
+
+def grade(elevation, distance, span=GRADE_SPAN, maxGrade=MAX_GRADE):
+    """
+    Rise over run (0.05 is 5%) from elevation and distance in the same unit, using the samples span either side.
+    Where the distance barely moves (stopped) the grade is 0, and it is clipped to +-maxGrade.
+    """
+    elevation = np.asarray(elevation, dtype=float)
+    distance = np.asarray(distance, dtype=float)
+    start, end = _window(len(elevation), span)
+    rise = elevation[end - 1] - elevation[start]
+    run = distance[end - 1] - distance[start]
+    result = np.divide(rise, run, out=np.zeros_like(rise), where=run > 1)
+    return np.clip(result, -maxGrade, maxGrade)
+
+
+def elevationChange(elevation, threshold=ELEVATION_THRESHOLD):
+    """
+    Total (gain, loss) where climbs and descents smaller than threshold are ignored as noise.
+
+    A climb or descent is counted in full from one confirmed extreme to the next, once the elevation has
+    reversed from it by at least threshold. Direction only changes at turning points, so those are found
+    with array operations first and only they are walked.
+    """
+    elevation = np.asarray(elevation, dtype=float)
+    elevation = elevation[np.concatenate([[True], np.diff(elevation) != 0])] if len(elevation) else elevation
+    if len(elevation) < 2:
+        return 0.0, 0.0
+    direction = np.sign(np.diff(elevation))
+    turning = np.concatenate([[True], direction[1:] != direction[:-1], [True]])
+    gain = loss = 0.0
+    low = high = elevation[0]
+    anchor = extreme = None
+    climbing = None
+    for point in elevation[turning]:
+        if climbing is None:
+            # no direction yet: wait for a move of threshold away from the lowest or highest point so far
+            low, high = min(low, point), max(high, point)
+            if point - low >= threshold:
+                climbing, anchor, extreme = True, low, point
+            elif high - point >= threshold:
+                climbing, anchor, extreme = False, high, point
+        elif climbing:
+            if point > extreme:
+                extreme = point
+            elif extreme - point >= threshold:
+                gain += extreme - anchor
+                climbing, anchor, extreme = False, extreme, point
+        else:
+            if point < extreme:
+                extreme = point
+            elif point - extreme >= threshold:
+                loss += anchor - extreme
+                climbing, anchor, extreme = True, extreme, point
+    if climbing:
+        gain += extreme - anchor
+    elif climbing is False:
+        loss += anchor - extreme
+    return float(gain), float(loss)
+
+
+def hrDrift(hr, velocity, seconds):
+    """
+    Aerobic decoupling in percent: how much speed per heartbeat dropped from the first to the second half of the
+    moving time. Positive means HR rose for the same pace. NaN without enough moving samples with HR.
+    """
+    hr = np.asarray(hr, dtype=float)
+    velocity = np.asarray(velocity, dtype=float)
+    seconds = np.asarray(seconds, dtype=float)
+    moving = (velocity > 0) & (hr > 0)
+    if moving.sum() < 2:
+        return float('nan')
+    elapsed = seconds[moving]
+    first = elapsed < (elapsed[0] + elapsed[-1]) / 2
+    if first.all() or not first.any():
+        return float('nan')
+    speed, beats = velocity[moving], hr[moving]
+    before = speed[first].mean() / beats[first].mean()
+    after = speed[~first].mean() / beats[~first].mean()
+    return float((before - after) / before * 100)
+
+
+def gradeAdjustedVelocity(velocity, grades):
+    """
+    Flat-ground speed with the same metabolic cost as velocity at each grade (Minetti cost of running).
+    """
+    cost = np.polyval(MINETTI, np.clip(np.asarray(grades, dtype=float), -MAX_GRADE, MAX_GRADE))
+    return np.asarray(velocity, dtype=float) * cost / MINETTI_FLAT
@@ -0,0 +1,229 @@
+import datetime
+import os
+import sqlite3
+from units import PAGE_SIZE, STORE
+
+COLUMNS = ['id', 'name', 'start_date', 'distance', 'moving_time', 'elapsed_time', 'total_elevation_gain',
+           'type', 'average_speed', 'max_speed', 'average_heartrate', 'max_heartrate']
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS activities (
+    id INTEGER PRIMARY KEY,
+    name TEXT,
+    start_date TEXT NOT NULL,
+    distance REAL,
+    moving_time INTEGER,
+    elapsed_time INTEGER,
+    total_elevation_gain REAL,
+    type TEXT,
+    average_speed REAL,
+    max_speed REAL,
+    average_heartrate REAL,
+    max_heartrate REAL
+);
+CREATE INDEX IF NOT EXISTS activities_start_date ON activities (start_date);
+CREATE INDEX IF NOT EXISTS activities_distance ON activities (distance);
+CREATE INDEX IF NOT EXISTS activities_heartrate ON activities (average_heartrate);
+CREATE TABLE IF NOT EXISTS sync_state (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+# typed columns for runs(); type becomes a categorical once the chunks are joined
+DTYPES = {'id': 'int64', 'name': 'string', 'distance': 'float64', 'moving_time': 'Int64', 'elapsed_time': 'Int64',
+          'total_elevation_gain': 'float64', 'type': 'string', 'average_speed': 'float64', 'max_speed': 'float64',
+          'average_heartrate': 'float64', 'max_heartrate': 'float64'}
+
+RUN_FILTER = "type LIKE '%Run%'"
+
+
+def _number(value, cast=float):
+    return cast(value) if value is not None else None
+
+
+def isRun(activity):
+    activityType = getattr(activity.type, 'root', activity.type)
+    return activityType is not None and 'Run' in str(activityType)
+
+
+def activityRow(activity):
+    """
+    Flatten a stravalib activity into a tuple matching COLUMNS.
+    """
+    activityType = getattr(activity.type, 'root', activity.type)
+    startDate = activity.start_date.astimezone(datetime.timezone.utc).isoformat()
+    return (
+        int(activity.id),
+        activity.name,
+        startDate,
+        _number(activity.distance),
+        _number(activity.moving_time, int),
+        _number(activity.elapsed_time, int),
+        _number(activity.total_elevation_gain),
+        str(activityType) if activityType is not None else None,
+        _number(activity.average_speed) if activity.average_speed else None,
+        _number(activity.max_speed) if activity.max_speed else None,
+        _number(activity.average_heartrate),
+        _number(activity.max_heartrate),
+    )
+
+
+def pages(client, after=None, before=None, pageSize=None):
+    """
+    client.get_activities as a lazy iterator fetching pageSize activities per request (None: the client's
+    default). Strava lists newest first, or oldest first when after is given.
+    """
+    activities = client.get_activities(after=after, before=before)
+    if pageSize is not None and hasattr(activities, 'per_page'):
+        # stravalib's BatchedResultsIterator requests the next page only when the buffer runs out
+        activities.per_page = pageSize
+    return iter(activities)
+
+
+class ActivityStore:
+    """
+    Local SQLite copy of the athlete's activity list.
+
+    Only activities newer than the latest stored start_date are requested on sync, so
+    listing runs and resolving a rowId is answered from disk. The first sync can stop as soon as enough
+    recent runs are stored; later syncs keep listing older runs, from the oldest one stored, when more are needed.
+    """
+
+    def __init__(self, path=STORE):
+        self.path = path
+        folder = os.path.dirname(path)
+        if folder and not os.path.exists(folder):
+            os.makedirs(folder)
+        self.conn = sqlite3.connect(path)
+        hasState = self.conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'sync_state'").fetchone()
+        self.conn.executescript(SCHEMA)
+        if not hasState and self.conn.execute('SELECT 1 FROM activities LIMIT 1').fetchone():
+            # stores from before partial syncs always listed the whole history
+            self.setState('complete', '1')
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def latest(self):
+        row = self.conn.execute('SELECT MAX(start_date) FROM activities').fetchone()
+        if row[0] is None:
+            return None
+        return datetime.datetime.fromisoformat(row[0])
+
+    def state(self, key):
+        row = self.conn.execute('SELECT value FROM sync_state WHERE key = ?', (key,)).fetchone()
+        return row[0] if row else None
+
+    def setState(self, key, value):
+        with self.conn:
+            self.conn.execute('INSERT OR REPLACE INTO sync_state (key, value) VALUES (?, ?)', (key, value))
+
+    def oldest(self):
+        row = self.conn.execute('SELECT MIN(start_date) FROM activities').fetchone()
+        if row[0] is None:
+            return None
+        return datetime.datetime.fromisoformat(row[0])
+
+    def ingest(self, activities, need=None, pageSize=PAGE_SIZE):
+        """
+        Store the runs among activities one page at a time. The iterator is consumed lazily and left alone at
+        the end of the first page that brings the store to need runs, so no further page is requested.
+        Returns (written, exhausted).
+        """
+        written = 0
+        rows = []
+        for seen, activity in enumerate(activities, 1):
+            if isRun(activity):
+                rows.append(activityRow(activity))
+            if seen % pageSize == 0:
+                written += self.write(rows)
+                rows = []
+                if need is not None and self.count() >= need:
+                    return written, False
+        written += self.write(rows)
+        return written, True
+
+    def write(self, rows):
+        with self.conn:
+            self.conn.executemany(
+                f'INSERT OR REPLACE INTO activities ({", ".join(COLUMNS)}) VALUES ({", ".join("?" * len(COLUMNS))})',
+                rows
+            )
+        return len(rows)
+
+    def sync(self, client, full=False, need=None, pageSize=PAGE_SIZE):
+        """
+        Pull activities newer than the latest stored one, then, while the history isn't fully listed and fewer
+        than need runs are stored (need=None: always), older ones from the oldest stored backwards. Only listings
+        stopping at need use pageSize pages, the others keep the client's larger default ones.
+        full=True drops the store and re-lists everything. Returns the number of runs written.
+        """
+        if full:
+            with self.conn:
+                self.conn.execute('DELETE FROM activities')
+                self.conn.execute('DELETE FROM sync_state')
+        written = 0
+        latest = self.latest()
+        if latest is not None:
+            written += self.ingest(pages(client, after=latest), pageSize=pageSize)[0]
+        if self.state('complete') != '1' and (need is None or self.count() < need):
+            # newest first from where the last partial sync stopped
+            older = pages(client, before=self.oldest(), pageSize=pageSize if need is not None else None)
+            count, exhausted = self.ingest(older, need, pageSize)
+            written += count
+            if exhausted:
+                self.setState('complete', '1')
+        return written
+
+    def count(self):
+        return self.conn.execute(f'SELECT COUNT(*) FROM activities WHERE {RUN_FILTER}').fetchone()[0]
+
+    def runs(self, chunksize=10000):
+        """
+        All stored runs, most recent first, so the positional index matches rowId.
+        """
+        import pandas as pd
+        query = f'SELECT {", ".join(COLUMNS)} FROM activities WHERE {RUN_FILTER} ORDER BY start_date DESC'
+        chunks = list(pd.read_sql_query(query, self.conn, parse_dates=['start_date'], dtype=DTYPES,
+                                        chunksize=chunksize))
+        if not chunks:
+            return pd.DataFrame({column: pd.Series(dtype=DTYPES.get(column, 'datetime64[ns, UTC]'))
+                                 for column in COLUMNS}).astype({'type': 'category'})
+        frame = pd.concat(chunks, ignore_index=True)
+        frame['type'] = frame['type'].astype('category')
+        return frame
+
+    def totals(self):
+        """
+        (year, runs, meters, moving seconds, elevation gain, longest run in meters) per year, newest first.
+        """
+        query = f'SELECT substr(start_date, 1, 4) AS year, COUNT(*), SUM(distance), SUM(moving_time), ' \
+                f'SUM(total_elevation_gain), MAX(distance) FROM activities WHERE {RUN_FILTER} ' \
+                f'GROUP BY year ORDER BY year DESC'
+        return self.conn.execute(query).fetchall()
+
+    def getRun(self, rowId):
+        import pandas as pd
+        assert rowId >= 0, 'Invalid rowId'
+        query = f'SELECT {", ".join(COLUMNS)} FROM activities WHERE {RUN_FILTER} ' \
+                f'ORDER BY start_date DESC LIMIT 1 OFFSET ?'
+        row = self.conn.execute(query, (rowId,)).fetchone()
+        assert row is not None, 'Invalid rowId'
+        return pd.Series(dict(zip(COLUMNS, row)))
+
+    def has(self, activityId):
+        return self.conn.execute('SELECT 1 FROM activities WHERE id = ?', (int(activityId),)).fetchone() is not None
+
+    def getActivity(self, activityId):
+        import pandas as pd
+        query = f'SELECT {", ".join(COLUMNS)} FROM activities WHERE id = ?'
+        row = self.conn.execute(query, (int(activityId),)).fetchone()
+        assert row is not None, f'No stored activity {activityId}'
+        return pd.Series(dict(zip(COLUMNS, row)))
@@ -0,0 +1,162 @@
+import json
+import os
+import shutil
+import tempfile
+import threading
+import numpy as np
+from units import STREAM_CACHE, STREAM_CACHE_BYTES
+
+STREAM_TYPES = ['heartrate', 'velocity_smooth', 'altitude', 'time', 'distance']
+DTYPES = {
+    'heartrate': np.int16,
+    'velocity_smooth': np.float64,
+    'altitude': np.float64,
+    'time': np.int32,
+    'distance': np.float64,
+}
+META = 'meta.json'
+# running byte total of every entry, so a put doesn't have to walk the whole cache
+INDEX = '.bytes'
+
+
+class StreamCache:
+    """
+    On-disk cache of activity streams keyed by (activity_id, resolution).
+
+    Each entry is a folder of .npy files, one per stream type, loaded memory-mapped. Finished
+    activities never change, so entries are only evicted (least recently used first) once the
+    cache grows past maxBytes. The total size is kept in an index file and only recounted when evicting.
+    """
+
+    def __init__(self, folder=STREAM_CACHE, maxBytes=STREAM_CACHE_BYTES):
+        self.folder = folder
+        self.maxBytes = maxBytes
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        if not os.path.exists(folder):
+            os.makedirs(folder)
+
+    def path(self, activity_id, resolution):
+        return os.path.join(self.folder, f'{int(activity_id)}_{resolution}')
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'bytes': self.size()}
+
+    def contains(self, activity_id, resolution):
+        return os.path.exists(os.path.join(self.path(activity_id, resolution), META))
+
+    def get(self, activity_id, resolution):
+        """
+        Return {type: array or None} for a cached entry, or None on a miss.
+        """
+        entry = self.path(activity_id, resolution)
+        if not os.path.exists(os.path.join(entry, META)):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return self.load(entry)
+
+    def load(self, entry):
+        with open(os.path.join(entry, META), 'r') as f:
+            present = json.load(f)['types']
+        streams = {}
+        for kind in STREAM_TYPES:
+            if kind in present:
+                streams[kind] = np.load(os.path.join(entry, f'{kind}.npy'), mmap_mode='r')
+            else:
+                streams[kind] = None
+        os.utime(entry)
+        return streams
+
+    def put(self, activity_id, resolution, streams):
+        """
+        Store fetched streams and return them loaded back from disk.
+        """
+        entry = self.path(activity_id, resolution)
+        staging = tempfile.mkdtemp(dir=self.folder, prefix='.staging_')
+        present = []
+        for kind in STREAM_TYPES:
+            data = streams.get(kind)
+            if data is None:
+                continue
+            np.save(os.path.join(staging, f'{kind}.npy'), np.asarray(data, dtype=DTYPES[kind]))
+            present.append(kind)
+        with open(os.path.join(staging, META), 'w') as f:
+            json.dump({'activity_id': int(activity_id), 'resolution': resolution, 'types': present}, f)
+        added = entrySize(staging)
+        removed = 0
+        if os.path.exists(entry):
+            removed = entrySize(entry)
+            shutil.rmtree(entry, ignore_errors=True)
+        try:
+            os.replace(staging, entry)
+        except OSError:
+            # another worker stored the same entry first and counted it
+            shutil.rmtree(staging, ignore_errors=True)
+            added = 0
+        if self.adjust(added - removed) > self.maxBytes:
+            self.evict(keep=entry)
+        return self.load(entry)
+
+    def entries(self):
+        for name in os.listdir(self.folder):
+            entry = os.path.join(self.folder, name)
+            if name.startswith('.') or not os.path.isdir(entry):
+                continue
+            yield entry, os.path.getmtime(entry), entrySize(entry)
+
+    def size(self):
+        return sum(size for _, _, size in self.entries())
+
+    def total(self):
+        """
+        Bytes cached according to the index, counted from the entries when there's no index yet.
+        """
+        total = self.indexed()
+        return self.record(self.size()) if total is None else total
+
+    def indexed(self):
+        try:
+            with open(os.path.join(self.folder, INDEX), 'r') as f:
+                return int(f.read())
+        except (OSError, ValueError):
+            return None
+
+    def record(self, total):
+        index = os.path.join(self.folder, INDEX)
+        temp = f'{index}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(temp, 'w') as f:
+            f.write(str(total))
+        os.replace(temp, index)
+        return total
+
+    def adjust(self, delta):
+        # workers in other processes may race on the index; evict recounts it, so drift doesn't accumulate
+        with self.lock:
+            total = self.indexed()
+            # without an index, counting the entries already includes this change
+            return self.record(self.size() if total is None else max(total + delta, 0))
+
+    def evict(self, keep=None):
+        with self.lock:
+            entries = sorted(self.entries(), key=lambda e: e[1])
+            total = sum(size for _, _, size in entries)
+            for entry, _, size in entries:
+                if total <= self.maxBytes:
+                    break
+                if entry == keep:
+                    continue
+                shutil.rmtree(entry, ignore_errors=True)
+                total -= size
+            self.record(total)
+
+    def clear(self):
+        with self.lock:
+            for entry, _, _ in list(self.entries()):
+                shutil.rmtree(entry, ignore_errors=True)
+            self.record(0)
+
+
+def entrySize(entry):
+    return sum(os.path.getsize(os.path.join(entry, f)) for f in os.listdir(entry))
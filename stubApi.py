@@ -0,0 +1,188 @@
+import datetime
+import json
+import math
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+STREAMS_PATH = re.compile(r'^/api/v3/activities/(\d+)/streams$')
+ACTIVITIES_PATH = '/api/v3/athlete/activities'
+ZONES_PATH = '/api/v3/athlete/zones'
+FIRST_START = datetime.datetime(2024, 1, 1, 7, tzinfo=datetime.timezone.utc)
+
+
+def fakeStreams(activity_id, samples=600):
+    """
+    Deterministic streams for an activity id: steady running with a slow HR climb and rolling hills.
+    """
+    time_index = list(range(samples))
+    velocity = [round(3.0 + 0.4 * math.sin((i + activity_id) / 40), 3) for i in time_index]
+    distance = []
+    total = 0.0
+    for v in velocity:
+        total += v
+        distance.append(round(total, 1))
+    return {
+        'time': time_index,
+        'distance': distance,
+        'velocity_smooth': velocity,
+        'heartrate': [int(125 + 40 * i / samples + 5 * math.sin(i / 25)) for i in time_index],
+        'altitude': [round(100 + 15 * math.sin((i + activity_id) / 90), 1) for i in time_index],
+    }
+
+
+def fakeActivities(athlete, count):
+    """
+    count daily runs for the athlete numbered athlete, oldest first, with ids that don't collide across athletes.
+    """
+    activities = []
+    for i in range(count):
+        distance = 5000 + 1000 * ((i * 7 + athlete) % 11)
+        activities.append({
+            'id': (athlete + 1) * 100000 + i,
+            'name': f'Athlete {athlete} run {i}',
+            'type': 'Run',
+            'sport_type': 'Run',
+            'start_date': (FIRST_START + datetime.timedelta(days=i)).isoformat().replace('+00:00', 'Z'),
+            'distance': float(distance),
+            'moving_time': int(distance / 3),
+            'elapsed_time': int(distance / 3) + 60,
+            'total_elevation_gain': 20.0,
+            'average_speed': 3.0,
+            'max_speed': 4.2,
+            'average_heartrate': 150.0,
+            'max_heartrate': 170.0,
+        })
+    return activities
+
+
+def fakeZones():
+    bounds = [0, 129, 148, 162, 176, -1]
+    return {'heart_rate': {'custom_zones': False,
+                           'zones': [{'min': low, 'max': high} for low, high in zip(bounds, bounds[1:])]}}
+
+
+class StubApi:
+    """
+    Local stand-in for the Strava streams, activity list and zones endpoints with rate-limit headers.
+
+    At most shortLimit requests are served per window seconds, after which it answers 429 with Retry-After,
+    mirroring how the real API behaves around its 15 minute quota. Point a TokenBucket with
+    windows=(window, ...) at it to exercise the scheduler without waiting for real quarter hours.
+    Every bearer token is a separate athlete with activities runs; requests counts what each token asked for.
+    """
+
+    def __init__(self, shortLimit=100, dailyLimit=1000, window=2, samples=600, port=0, activities=30):
+        self.shortLimit = shortLimit
+        self.dailyLimit = dailyLimit
+        self.window = window
+        self.samples = samples
+        self.activities = activities
+        self.athletes = {}
+        self.requests = {}
+        self.lock = threading.Lock()
+        self.windowId = int(time.time() // window)
+        self.shortUsage = 0
+        self.dailyUsage = 0
+        self.served = []
+        self.throttled = 0
+        self.server = ThreadingHTTPServer(('127.0.0.1', port), self.handler())
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def baseUrl(self):
+        return f'http://127.0.0.1:{self.server.server_address[1]}/api/v3'
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def take(self):
+        with self.lock:
+            now = time.time()
+            # windows are aligned to multiples of window seconds, like Strava's quarter hours
+            if int(now // self.window) != self.windowId:
+                self.windowId = int(now // self.window)
+                self.shortUsage = 0
+            if self.shortUsage >= self.shortLimit or self.dailyUsage >= self.dailyLimit:
+                self.throttled += 1
+                return False, math.ceil((self.windowId + 1) * self.window - now)
+            self.shortUsage += 1
+            self.dailyUsage += 1
+            return True, 0
+
+    def athlete(self, authorization):
+        """
+        Number of the athlete a bearer token belongs to, counting the request against it.
+        """
+        token = (authorization or '').removeprefix('Bearer ')
+        with self.lock:
+            self.requests[token] = self.requests.get(token, 0) + 1
+            return self.athletes.setdefault(token, len(self.athletes))
+
+    def listActivities(self, athlete, query):
+        """
+        One page of /athlete/activities: newest first, oldest first when after is given, like Strava.
+        """
+        before = int(query.get('before', [0])[0]) or None
+        after = int(query.get('after', [0])[0]) or None
+        page = int(query.get('page', [1])[0])
+        perPage = int(query.get('per_page', [30])[0])
+        selected = [a for a in fakeActivities(athlete, self.activities)
+                    if (before is None or datetime.datetime.fromisoformat(a['start_date']).timestamp() < before)
+                    and (after is None or datetime.datetime.fromisoformat(a['start_date']).timestamp() > after)]
+        if after is None:
+            selected.reverse()
+        return selected[(page - 1) * perPage:page * perPage]
+
+    def headers(self):
+        return {
+            'X-RateLimit-Limit': f'{self.shortLimit},{self.dailyLimit}',
+            'X-RateLimit-Usage': f'{self.shortUsage},{self.dailyUsage}',
+        }
+
+    def handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                url = urlparse(self.path)
+                match = STREAMS_PATH.match(url.path)
+                if not match and url.path not in [ACTIVITIES_PATH, ZONES_PATH]:
+                    return self.reply(404, {'message': 'Record Not Found'})
+                allowed, wait = stub.take()
+                if not allowed:
+                    return self.reply(429, {'message': 'Rate Limit Exceeded'}, {'Retry-After': str(max(wait, 1))})
+                athlete = stub.athlete(self.headers.get('Authorization'))
+                if url.path == ACTIVITIES_PATH:
+                    return self.reply(200, stub.listActivities(athlete, parse_qs(url.query)))
+                if url.path == ZONES_PATH:
+                    return self.reply(200, fakeZones())
+                activity_id = int(match.group(1))
+                with stub.lock:
+                    stub.served.append(activity_id)
+                streams = fakeStreams(activity_id, stub.samples)
+                body = {kind: {'data': data, 'series_type': 'distance', 'original_size': len(data),
+                               'resolution': 'high'} for kind, data in streams.items()}
+                self.reply(200, body)
+
+            def reply(self, status, body, extra=None):
+                payload = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(payload)))
+                for key, value in {**stub.headers(), **(extra or {})}.items():
+                    self.send_header(key, value)
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
@@ -0,0 +1,160 @@
+import datetime
+import numpy as np
+
+DEFAULT_ZONES = [
+    {'min': 0, 'max': 129},
+    {'min': 129, 'max': 148},
+    {'min': 148, 'max': 162},
+    {'min': 162, 'max': 176},
+    {'min': 176, 'max': -1},
+]
+
+RESOLUTION_POINTS = {'low': 100, 'medium': 1000, 'high': 10000}
+
+
+def syntheticStreams(samples=10000, seed=0, pauses=3, dropouts=3):
+    """
+    Realistic-looking raw streams (Strava units: m/s, m, s, bpm) for a run of samples points.
+    Includes zero-velocity pauses with the clock running and HR dropouts reported as 0 bpm.
+    """
+    rng = np.random.default_rng(seed)
+    dt = np.where(rng.random(samples) < 0.02, rng.integers(2, 6, samples), 1)
+    dt[0] = 0
+    time_index = np.cumsum(dt)
+
+    base = rng.uniform(2.6, 4.2)
+    effort = np.convolve(rng.standard_normal(samples), np.ones(60) / 60, mode='same')
+    velocity = np.clip(base + 0.6 * effort + 0.1 * rng.standard_normal(samples), 0.5, None)
+    for start in rng.integers(0, samples, pauses):
+        velocity[start:start + rng.integers(10, 120)] = 0
+    distance = np.cumsum(velocity * dt)
+
+    hills = np.cumsum(np.convolve(rng.standard_normal(samples), np.ones(200) / 200, mode='same'))
+    altitude = 50 + 20 * hills / max(np.abs(hills).max(), 1) + 0.3 * rng.standard_normal(samples)
+
+    # HR follows effort with a lag and drifts up over the run
+    target = 120 + 12 * (velocity - 2.5) + 15 * np.linspace(0, 1, samples)
+    smoothed = np.convolve(target, np.full(30, 1 / 30), mode='same')
+    heartrate = 95 + (smoothed - 95) * (1 - np.exp(-np.arange(samples) / 120))
+    heartrate = np.round(heartrate + rng.normal(0, 1.5, samples)).astype(int)
+    for start in rng.integers(0, samples, dropouts):
+        heartrate[start:start + rng.integers(5, 60)] = 0
+
+    return {
+        'time': time_index.astype(int),
+        'distance': distance,
+        'velocity_smooth': velocity,
+        'altitude': altitude,
+        'heartrate': heartrate,
+    }
+
+
+def syntheticActivities(count=500, seed=0, start=datetime.datetime(2020, 1, 1, tzinfo=datetime.timezone.utc)):
+    """
+    Summary activities, oldest first, mostly runs with the odd ride and walk mixed in.
+    """
+    from stravalib import model
+    rng = np.random.default_rng(seed)
+    gaps = rng.exponential(1.4, count)
+    types = rng.choice(['Run', 'Run', 'Run', 'Run', 'VirtualRun', 'Ride', 'Walk'], count)
+    activities = []
+    when = start
+    for i in range(count):
+        when = when + datetime.timedelta(days=float(gaps[i]), hours=float(rng.uniform(0, 3)))
+        distance = float(rng.uniform(3000, 25000))
+        speed = float(rng.uniform(2.6, 4.2))
+        activities.append(model.SummaryActivity(
+            id=10_000 + i,
+            name=f'{types[i]} {i}',
+            start_date=when,
+            distance=distance,
+            moving_time=int(distance / speed),
+            elapsed_time=int(distance / speed * 1.05),
+            total_elevation_gain=float(rng.uniform(0, 400)),
+            type=str(types[i]),
+            average_speed=speed,
+            max_speed=speed * 1.4,
+            average_heartrate=float(rng.uniform(130, 165)),
+            max_heartrate=int(rng.integers(165, 190)),
+        ))
+    return activities
+
+
+class SyntheticStream:
+    def __init__(self, data):
+        self.data = data
+
+
+class SyntheticPages:
+    """
+    Lazy pages like stravalib's BatchedResultsIterator: a page is only 'requested' (and counted as
+    activity_pages) when iteration reaches it.
+    """
+
+    per_page = 200
+
+    def __init__(self, client, activities):
+        self.client = client
+        self.activities = activities
+
+    def __iter__(self):
+        page = 0
+        while True:
+            batch = self.activities[page * self.per_page:(page + 1) * self.per_page]
+            self.client.count('activity_pages')
+            yield from batch
+            if len(batch) < self.per_page:
+                return
+            page += 1
+
+
+class SyntheticZones:
+    def __init__(self, zones):
+        self.zones = zones
+
+    def dict(self):
+        return {'heart_rate': {'custom_zones': False, 'zones': self.zones}}
+
+
+class SyntheticClient:
+    """
+    Offline stand-in for stravalib.Client with the methods this project calls, backed by generated data.
+    Counts calls per method in self.calls.
+    """
+
+    def __init__(self, activities=100, samples=10000, zones=DEFAULT_ZONES, seed=0):
+        self.activities = syntheticActivities(activities, seed) if isinstance(activities, int) else activities
+        self.samples = samples
+        self.zones = zones
+        self.seed = seed
+        self.access_token = 'synthetic'
+        self.calls = {}
+
+    def count(self, method):
+        self.calls[method] = self.calls.get(method, 0) + 1
+
+    def get_athlete(self):
+        self.count('get_athlete')
+        return {'id': 0}
+
+    def get_activities(self, before=None, after=None, limit=None):
+        self.count('get_activities')
+        # newest first, oldest first when listing from after, as Strava does
+        ordered = self.activities if after is not None else reversed(self.activities)
+        selected = [a for a in ordered
+                    if (after is None or a.start_date > after) and (before is None or a.start_date < before)]
+        return SyntheticPages(self, selected[:limit] if limit else selected)
+
+    def get_activity_streams(self, activity_id, types=None, resolution=None, series_type=None):
+        self.count('get_activity_streams')
+        streams = syntheticStreams(self.samples, seed=self.seed + int(activity_id))
+        points = RESOLUTION_POINTS.get(resolution)
+        if points and points < self.samples:
+            # evenly spaced samples, as Strava returns for the lower resolutions
+            keep = np.linspace(0, self.samples - 1, points).round().astype(int)
+            streams = {kind: data[keep] for kind, data in streams.items()}
+        return {kind: SyntheticStream(data.tolist()) for kind, data in streams.items() if not types or kind in types}
+
+    def get_athlete_zones(self):
+        self.count('get_athlete_zones')
+        return SyntheticZones(self.zones)
@@ -0,0 +1,236 @@
+import multiprocessing
+import os
+import shutil
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+import units
+from fetcher import TokenBucket, pooledSession, prefetchStreams, retryAfter
+from streams import StreamCache, STREAM_TYPES
+from tokens import TokenStore
+
+CREDENTIALS = 'credentials.txt'
+
+
+class Athlete:
+    """
+    One registered athlete. Their folder is laid out like a single-athlete checkout: credentials.txt, tokens.json,
+    activities.db, streams/, zones.json and the runs/ outputs.
+    """
+
+    def __init__(self, name, folder):
+        self.name = name
+        self.folder = folder
+
+    def path(self, *names):
+        return os.path.join(self.folder, *names)
+
+    def credentials(self):
+        from functions import readCredentials
+        return readCredentials(self.path(CREDENTIALS))
+
+    def tokens(self):
+        return TokenStore(*self.credentials(), path=self.path(units.TOKENS))
+
+
+class Registry:
+    """
+    Athletes by name, one folder each under units.ATHLETES_FOLDER.
+    """
+
+    def __init__(self, folder=units.ATHLETES_FOLDER):
+        self.folder = folder
+
+    def names(self):
+        if not os.path.exists(self.folder):
+            return []
+        return sorted(name for name in os.listdir(self.folder)
+                      if os.path.exists(os.path.join(self.folder, name, CREDENTIALS)))
+
+    def athlete(self, name):
+        assert name in self.names(), f'No athlete {name} in {self.folder}/, register them with `team --add {name}`'
+        return Athlete(name, os.path.join(self.folder, name))
+
+    def athletes(self, names=None):
+        return [self.athlete(name) for name in (names or self.names())]
+
+    def add(self, name, credentials=CREDENTIALS):
+        """
+        Register name with a copy of a credentials.txt and authorize them in the browser if no tokens are stored.
+        """
+        from functions import setUpClient
+        athlete = Athlete(name, os.path.join(self.folder, name))
+        if not os.path.exists(athlete.folder):
+            os.makedirs(athlete.folder)
+        shutil.copyfile(credentials, athlete.path(CREDENTIALS))
+        setUpClient(*athlete.credentials(), tokens=athlete.tokens())
+        return athlete
+
+
+class ApiPages:
+    """
+    Lazy /athlete/activities listing, one request per per_page activities, like stravalib's iterator.
+    """
+
+    def __init__(self, client, params, limit=None):
+        self.client = client
+        self.params = params
+        self.limit = limit
+        self.per_page = 200
+
+    def __iter__(self):
+        from stravalib import model
+        page = 1
+        returned = 0
+        while True:
+            batch = self.client.get('athlete/activities', dict(self.params, page=page, per_page=self.per_page))
+            for activity in batch:
+                if self.limit is not None and returned >= self.limit:
+                    return
+                returned += 1
+                yield model.SummaryActivity.model_validate(activity)
+            if len(batch) < self.per_page:
+                return
+            page += 1
+
+
+class ApiClient:
+    """
+    The part of stravalib's Client used here (activity list, streams, zones), sent over a shared pooled session.
+
+    Every request first takes a token from bucket, and a 429 holds the bucket until the quota resets, so one
+    athlete running out of requests doesn't hold up the others. Responses are parsed into the same stravalib
+    models the real client returns. baseUrl can point at a stubApi.StubApi.
+    """
+
+    def __init__(self, tokens, session, bucket, baseUrl=units.STRAVA_API):
+        self.tokens = tokens
+        self.session = session
+        self.bucket = bucket
+        self.baseUrl = baseUrl.rstrip('/')
+        self.requests = 0
+        self.current = None
+
+    @property
+    def access_token(self):
+        if not self.tokens.fresh(self.current):
+            self.current = self.tokens.current()
+            assert self.current is not None, f'No tokens in {self.tokens.path}, authorize with `runThis.py team --add`'
+        return self.current['access_token']
+
+    def get(self, path, params=None):
+        while True:
+            self.bucket.block()
+            response = self.session.get(f'{self.baseUrl}/{path}', params=params, timeout=30,
+                                        headers={'Authorization': f'Bearer {self.access_token}'})
+            self.requests += 1
+            self.bucket.update(response.headers)
+            if response.status_code == 429:
+                self.bucket.exhaust(retryAfter(response.headers))
+                continue
+            response.raise_for_status()
+            return response.json()
+
+    def get_activities(self, before=None, after=None, limit=None):
+        params = {key: int(value.timestamp()) for key, value in [('before', before), ('after', after)] if value}
+        return ApiPages(self, params, limit)
+
+    def get_activity_streams(self, activity_id, types=None, resolution=None, series_type=None):
+        from stravalib import model
+        params = {'keys': ','.join(types or STREAM_TYPES), 'key_by_type': 'true', 'resolution': resolution or 'high'}
+        body = self.get(f'activities/{int(activity_id)}/streams', params)
+        return {kind: model.Stream.model_validate(stream) for kind, stream in body.items()}
+
+    def get_athlete_zones(self):
+        from stravalib import strava_model
+        return strava_model.Zones.model_validate(self.get('athlete/zones'))
+
+
+def errorText(e):
+    return ''.join(traceback.format_exception_only(type(e), e)).strip()
+
+
+def _renderIn(folder, activityId, options):
+    from render import makePlots
+    # workers run one task at a time, so moving into the athlete's folder namespaces every relative output path
+    os.chdir(folder)
+    start = time.perf_counter()
+    # the pool already has a worker per core, so each renders its figures serially
+    makePlots(None, None, sync=False, activityId=activityId, **dict(options, figureWorkers=1))
+    return time.perf_counter() - start
+
+
+class TeamScheduler:
+    """
+    Sync and render runs for several athletes at once.
+
+    Each athlete's API work (activity sync, zones, stream prefetch) runs on its own thread through one pooled
+    session, limited by the rate-limit bucket of their application: athletes registered with the same client id
+    share a bucket, others have their own. An athlete's renders go to a shared process pool as soon as their
+    streams are in, so rendering one athlete overlaps with syncing the next.
+    """
+
+    def __init__(self, athletes, baseUrl=units.STRAVA_API, workers=None, bucketOptions=None):
+        self.athletes = athletes
+        self.workers = workers or os.cpu_count()
+        self.session = pooledSession(units.FETCH_CONCURRENCY * max(len(athletes), 1))
+        buckets = {}
+        self.clients = {}
+        for athlete in athletes:
+            tokens = athlete.tokens()
+            bucket = buckets.get(tokens.client_id)
+            if bucket is None:
+                bucket = buckets[tokens.client_id] = TokenBucket(**(bucketOptions or {}))
+            self.clients[athlete.name] = ApiClient(tokens, self.session, bucket, baseUrl)
+
+    def prepare(self, athlete, rowIds=None, resolution=units.RESOLUTION):
+        """
+        Sync an athlete's store and zones and fetch the streams to render. Returns the activity ids.
+        """
+        from HRZone import getAthleteZones
+        from store import ActivityStore
+        client = self.clients[athlete.name]
+        with ActivityStore(athlete.path(units.STORE)) as store:
+            store.sync(client, need=max(rowIds) + 1 if rowIds else None)
+            ids = [int(i) for i in store.runs()['id']]
+        ids = [ids[r] for r in rowIds if r < len(ids)] if rowIds is not None else ids
+        getAthleteZones(client, path=athlete.path(units.ZONES_CACHE))
+        fetched = prefetchStreams(client, ids, resolution, cache=StreamCache(athlete.path(units.STREAM_CACHE)),
+                                  session=self.session, bucket=client.bucket, baseUrl=client.baseUrl)
+        client.requests += fetched['requests']
+        assert not fetched['failures'], f"Streams failed for {athlete.name}: {fetched['failures']}"
+        return ids
+
+    def run(self, rowIds=None, **renderOptions):
+        """
+        Render rowIds (None: every run) of every athlete with makePlots and renderOptions. Returns
+        {athlete: {'rendered', 'failures', 'requests'}}.
+        """
+        resolution = renderOptions.get('resolution', units.RESOLUTION)
+        summary = {athlete.name: {'rendered': 0, 'failures': {}, 'requests': 0} for athlete in self.athletes}
+        # workers start while the sync threads are running, so they're never forked from this process
+        method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+        with ThreadPoolExecutor(max_workers=max(len(self.athletes), 1)) as threads, \
+                ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context(method)) as pool:
+            syncs = {threads.submit(self.prepare, athlete, rowIds, resolution): athlete for athlete in self.athletes}
+            renders = {}
+            for future in as_completed(syncs):
+                athlete = syncs[future]
+                try:
+                    ids = future.result()
+                except Exception as e:
+                    summary[athlete.name]['failures']['sync'] = errorText(e)
+                    continue
+                folder = os.path.abspath(athlete.folder)
+                for activityId in ids:
+                    renders[pool.submit(_renderIn, folder, activityId, renderOptions)] = (athlete.name, activityId)
+            for future in as_completed(renders):
+                name, activityId = renders[future]
+                try:
+                    future.result()
+                    summary[name]['rendered'] += 1
+                except Exception as e:
+                    summary[name]['failures'][activityId] = errorText(e)
+        for athlete in self.athletes:
+            summary[athlete.name]['requests'] = self.clients[athlete.name].requests
+        return summary
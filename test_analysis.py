@@ -0,0 +1,39 @@
+import numpy as np
+from analysis import analyzeRun, runFrame
+from export import compactFrame
+from synthetic import DEFAULT_ZONES, syntheticStreams
+
+
+def syntheticFrame(samples=5000):
+    streams = syntheticStreams(samples)
+    data = runFrame(streams['heartrate'], streams['velocity_smooth'], streams['altitude'], streams['time'],
+                    streams['distance'], DEFAULT_ZONES)
+    return data, np.asarray(streams['velocity_smooth'], dtype=float)
+
+
+def test_pace_matches_velocity_row_by_row():
+    data, velocity = syntheticFrame()
+    moving = velocity > 0
+    assert not moving.all(), 'synthetic run should include pauses'
+    np.testing.assert_allclose(data['Pace'].to_numpy()[moving], 1609.344 / velocity[moving])
+    np.testing.assert_allclose(data['PaceTime'].to_numpy()[moving], 1609.344 / velocity[moving] / 60)
+    assert data['Pace'][~moving].isna().all()
+    assert (data['PaceStr'][~moving] == '').all()
+
+
+def test_export_pace_is_aligned():
+    data, velocity = syntheticFrame()
+    exported = compactFrame(data, 1)
+    moving = velocity > 0
+    np.testing.assert_allclose(exported['pace_s_mi'].to_numpy()[moving], 1609.344 / velocity[moving], rtol=1e-6)
+    assert exported['pace_s_mi'][~moving].isna().all()
+
+
+def test_zone_pace_ignores_stopped_samples():
+    data, velocity = syntheticFrame()
+    summary, report = analyzeRun(data, 1, 'Synthetic')
+    for zone, stats in summary['zones'].items():
+        inZone = (data['Zone'] == zone).to_numpy() & (velocity > 0)
+        if inZone.any():
+            assert np.isclose(stats['Pace']['mean'], np.mean(1609.344 / velocity[inZone]))
+    assert np.isfinite(summary['correlation'])
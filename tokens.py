@@ -0,0 +1,100 @@
+import datetime
+import json
+import os
+import time
+from contextlib import contextmanager
+from units import TOKENS, TOKEN_MARGIN
+
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process lock, workers may refresh more than once
+    fcntl = None
+
+
+def expiryText(expires_at):
+    """
+    Token expiry in local 12-hour time, e.g. 'Mar 02, 2025 04:15 PM PST'.
+    """
+    expires = datetime.datetime.fromtimestamp(expires_at, datetime.timezone.utc).astimezone()
+    return f"{expires.strftime('%b %d, %Y %I:%M %p')} {expires.tzinfo}"
+
+
+class TokenStore:
+    """
+    Access token, refresh token and expiry on disk.
+
+    While the access token is known to be valid for more than margin seconds it is used as is, with no request
+    to check it. Closer to expiry it is refreshed with the refresh token. Refreshing holds an exclusive lock on
+    <path>.lock and re-reads the file first, so concurrent batch workers share one refresh.
+    """
+
+    def __init__(self, client_id=None, client_secret=None, path=TOKENS, margin=TOKEN_MARGIN, clock=time.time):
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.path = path
+        self.margin = margin
+        self.clock = clock
+
+    @contextmanager
+    def locked(self):
+        with open(f'{self.path}.lock', 'a') as lock:
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def read(self):
+        if not os.path.exists(self.path):
+            return None
+        with open(self.path, 'r') as f:
+            return json.load(f)
+
+    def save(self, tokens):
+        """
+        Persist the access_token/refresh_token/expires_at of an exchange or refresh response.
+        """
+        tokens = {key: tokens[key] for key in ['access_token', 'refresh_token', 'expires_at']}
+        temp = f'{self.path}.{os.getpid()}.tmp'
+        with open(os.open(temp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), 'w') as f:
+            json.dump(tokens, f)
+        os.replace(temp, self.path)
+        return tokens
+
+    def fresh(self, tokens):
+        return tokens is not None and tokens['expires_at'] - self.margin > self.clock()
+
+    def refresh(self, tokens):
+        from stravalib import Client
+        return Client().refresh_access_token(client_id=self.client_id, client_secret=self.client_secret,
+                                             refresh_token=tokens['refresh_token'])
+
+    def current(self):
+        """
+        Tokens valid for at least margin more seconds, refreshing them if needed. None when there is nothing
+        stored to refresh from and the user has to authorize again.
+        """
+        tokens = self.read()
+        if self.fresh(tokens):
+            return tokens
+        if tokens is None or not tokens.get('refresh_token') or self.client_id is None:
+            return None
+        with self.locked():
+            # another process may have refreshed while this one waited for the lock
+            tokens = self.read()
+            if not self.fresh(tokens):
+                tokens = self.save(self.refresh(tokens))
+        return tokens
+
+    def authorize(self, client):
+        """
+        Put the current tokens on client. Returns False when the user has to authorize again.
+        """
+        tokens = self.current()
+        if tokens is None:
+            return False
+        # only the access token: refreshing stays here, under the lock, instead of inside each client
+        client.access_token = tokens['access_token']
+        return True
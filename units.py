@@ -1,12 +1,61 @@
 MILES = 'mi'
 KILOMETERS = 'km'
 FACTOR = 1.609344
-PKL = 'client.pkl'
+TOKENS = 'tokens.json'
+# one folder per athlete for `runThis.py team`, each laid out like a single-athlete checkout
+ATHLETES_FOLDER = 'athletes'
+# refresh the access token when it has less than this many seconds left
+TOKEN_MARGIN = 10 * 60
 PLOT_FOLDER = 'plots'
 EXTENSION = '.html'
 ANALYSIS_FOLDER = 'analysis'
 RUN_FOLDER = 'runs'
+HISTORY_FOLDER = 'history'
+# per-run Parquet files under RUN_FOLDER/<name>, the partitioned dataset of every run under RUN_FOLDER
+EXPORT_FOLDER = 'data'
+DATASET_FOLDER = 'dataset'
+MANIFEST = 'manifest.json'
+# bump to re-render every run after changing shared plotting or analysis code
+RENDER_VERSION = 4
+# 'embed', 'shared' (one plotly.js per RUN_FOLDER) or 'cdn'
+OUTPUT_MODES = ['embed', 'shared', 'cdn']
+OUTPUT_MODE = 'shared'
+# points per line plot after downsampling, 0 to plot every sample
+PLOT_POINTS = 2000
+# processes building one run's figures, None for one per core
+FIGURE_WORKERS = None
+DOWNSAMPLING_METHODS = ['lttb', 'minmax']
+DOWNSAMPLING = 'lttb'
+# Strava stream resolutions, roughly 100, 1000 and 10000 points per stream
+RESOLUTIONS = ['low', 'medium', 'high']
+RESOLUTION = 'high'
+PREVIEW_RESOLUTION = 'medium'
+STORE = 'activities.db'
+# activities per request when listing only until a run is stored; full listings keep stravalib's 200
+PAGE_SIZE = 50
+STREAM_CACHE = 'streams'
+STREAM_CACHE_BYTES = 512 * 1024 * 1024
+ZONES_CACHE = 'zones.json'
+# recorded API responses for --record/--offline
+FIXTURES = 'fixtures'
+SERVE_HOST = '127.0.0.1'
+SERVE_PORT = 8050
+FRAME_CACHE_BYTES = 256 * 1024 * 1024
+FIGURE_CACHE_BYTES = 64 * 1024 * 1024
+STRAVA_API = 'https://www.strava.com/api/v3'
+FETCH_CONCURRENCY = 8
+FETCH_RETRIES = 3
+ZONES_TTL = 7 * 24 * 60 * 60
+# samples in the elevation moving average, climbs/descents under ELEVATION_THRESHOLD meters are ignored
+ELEVATION_SMOOTHING = 9
+ELEVATION_THRESHOLD = 2.0
+# grade is taken over GRADE_SPAN samples either side and clipped to +-MAX_GRADE
+GRADE_SPAN = 5
+MAX_GRADE = 0.45
+# best effort name -> meters
+BEST_EFFORTS = {'400m': 400, '1mi': 1609.344, '5k': 5000, '10k': 10000, 'half': 21097.5}
 
 # Change this for your desired row ID to be analyzed
 DEFAULT_VALUE = 0
+
 HR_ZONES = ['Endurance', 'Moderate', 'Tempo', 'Threshold', 'Redline']
\ No newline at end of file